@@ -16,13 +16,19 @@
 # You should have received a copy of the GNU General Public
 # License along with this program.
 
+import json
+
 from flask import Blueprint, render_template, request, flash
 from flask.ext.login import login_required
 
 from ..extensions import db
 from ..decorators import admin_required
+from ..refdata import refdata
+from ..pagecache import invalidate_all_pages
+from ..cachegen import cache_generation
 
 from ..user import User
+from ..maintain.models import ImportRun
 from .forms import UserForm, GlobalSettingsForm
 from .models import GlobalSettings
 
@@ -44,6 +50,9 @@ def index():
 
         db.session.add(conf)
         db.session.commit()
+        refdata.invalidate()
+        invalidate_all_pages()
+        cache_generation.bump()
 
         flash('Global settings updated.', 'success')
 
@@ -70,7 +79,42 @@ def user(user_id):
 
         db.session.add(user)
         db.session.commit()
+        # names and avatars of developers are shown on cached pages
+        invalidate_all_pages()
+        cache_generation.bump()
 
         flash('User updated.', 'success')
 
     return render_template('admincp/user.html', user=user, form=form)
+
+
+@admincp.route('/imports')
+@login_required
+@admin_required
+def imports():
+    runs = ImportRun.query.order_by(ImportRun.started_time.desc()).limit(50).all()
+    runs.reverse()
+
+    summaries = dict()
+    stage_names = set()
+    for run in runs:
+        summaries[run.id] = json.loads(run.summary)
+        stage_names.update(summaries[run.id].get('stages', dict()).keys())
+    stage_names = sorted(stage_names)
+
+    # stacked bars of the time spent per stage, scaled to a height of 200
+    max_duration = max([sum(s.get('stages', dict()).values()) for s in summaries.values()] or [0]) or 1.0
+    chart = list()
+    for i, run in enumerate(runs):
+        stages = summaries[run.id].get('stages', dict())
+        y = 200.0
+        segments = list()
+        for j, name in enumerate(stage_names):
+            h = stages.get(name, 0) / max_duration * 200
+            if h > 0:
+                y -= h
+                segments.append(dict(stage=name, index=j, y=y, height=h, secs=stages[name]))
+        chart.append(dict(run=run, x=i * 20 + 2, segments=segments))
+
+    return render_template('admincp/imports.html', runs=runs, summaries=summaries,
+                           stage_names=stage_names, chart=chart, active='imports')
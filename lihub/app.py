@@ -28,6 +28,10 @@ from .frontend import frontend
 from .repository import repository
 from .admincp import admincp
 from .extensions import db, mail, cache
+from .refdata import refdata
+from .cachegen import cache_generation
+from .search import component_search
+from .autocomplete import component_completer
 
 try:
     from .local_config import DefaultConfig
@@ -177,7 +181,13 @@ def configure_logging(app):
 def configure_hook(app):
     @app.before_request
     def before_request():
-        pass
+        # other processes, like the importer, announce changes to our data
+        if cache_generation.changed():
+            refdata.invalidate()
+            component_search.invalidate()
+            component_completer.invalidate()
+            if app.config.get('CACHE_TYPE') == 'simple':
+                cache.clear()
 
 
 def configure_error_handlers(app):
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public  License
+# as published by the Free Software Foundation; either version
+# 3.0 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.
+
+"""
+    Prefix completion of component names and IDs of the master repository.
+"""
+
+import threading
+
+from .extensions import db
+from .repository.models import Component
+from .refdata import refdata
+from .newrows import NewRowTracker
+
+# number of completions kept per trie node, the most a request can get
+MAX_COMPLETIONS = 10
+
+
+class Completion(object):
+    """
+    A completable component. Its popularity is the number of packages
+    which were imported for it.
+    """
+
+    def __init__(self, cid, name):
+        self.cid = cid
+        self.name = name
+        self.count = 0
+
+    def rank(self):
+        return (-self.count, self.name.lower(), self.cid)
+
+
+class _Node(object):
+    # slots keep the many trie nodes small
+    __slots__ = ('children', 'top')
+
+    def __init__(self, top=None):
+        # first character of the edge label -> (label, child node)
+        self.children = dict()
+        # best completions below this node, in rank order
+        self.top = top if top is not None else list()
+
+    def offer(self, entry):
+        if entry not in self.top:
+            if len(self.top) >= MAX_COMPLETIONS and entry.rank() >= self.top[-1].rank():
+                return
+            self.top.append(entry)
+        self.top.sort(key=Completion.rank)
+        del self.top[MAX_COMPLETIONS:]
+
+
+class PrefixTree(object):
+    """
+    Radix trie mapping keys to completions. Every node keeps the best
+    completions of all keys below it, so a lookup only walks the prefix.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+
+    def insert(self, key, entry):
+        node = self._root
+        node.offer(entry)
+        while key:
+            edge = node.children.get(key[0])
+            if edge is None:
+                leaf = _Node()
+                leaf.offer(entry)
+                node.children[key[0]] = (key, leaf)
+                return
+
+            label, child = edge
+            common = 0
+            while common < len(label) and common < len(key) and label[common] == key[common]:
+                common += 1
+            if common < len(label):
+                # split the edge, the new node has the same keys below it as the old child
+                middle = _Node(list(child.top))
+                middle.children[label[common]] = (label[common:], child)
+                node.children[key[0]] = (label[:common], middle)
+                child = middle
+            child.offer(entry)
+            node = child
+            key = key[common:]
+
+    def complete(self, prefix, limit):
+        node = self._root
+        while prefix:
+            edge = node.children.get(prefix[0])
+            if edge is None:
+                return list()
+            label, child = edge
+            if label.startswith(prefix):
+                return child.top[:limit]
+            if not prefix.startswith(label):
+                return list()
+            node = child
+            prefix = prefix[len(label):]
+        return node.top[:limit]
+
+
+class ComponentCompleter(object):
+    """
+    Completes component names and IDs, most popular first.
+
+    Components are only ever added, so when the cache generation changes
+    only the rows imported since the last update are read and inserted.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tree = PrefixTree()
+        self._entries = dict()
+        self._rows = NewRowTracker(Component.id)
+        self._stale = True
+
+    def _update(self):
+        mrepo = refdata.repository("master")
+        if not mrepo:
+            return
+        query = db.session.query(Component.id, Component.cid, Component.name) \
+                          .filter(Component.repository_id == mrepo.id,
+                                  Component.sdk == False) \
+                          .order_by(Component.id)
+        for cpt_id, cid, name in self._rows.fetch_new(query):
+            entry = self._entries.get(cid)
+            if entry is None:
+                entry = Completion(cid, name)
+                self._entries[cid] = entry
+            entry.name = name
+            entry.count += 1
+            self._tree.insert(cid.lower(), entry)
+            self._tree.insert(name.lower(), entry)
+
+    def invalidate(self):
+        self._stale = True
+
+    def complete(self, prefix, limit=MAX_COMPLETIONS):
+        with self._lock:
+            if self._stale:
+                self._stale = False
+                self._update()
+            return self._tree.complete(prefix.lower(), min(limit, MAX_COMPLETIONS))
+
+
+component_completer = ComponentCompleter()
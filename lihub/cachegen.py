@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public  License
+# as published by the Free Software Foundation; either version
+# 3.0 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.
+
+"""
+    Cache generation counter, shared by all processes through a small file.
+
+    Processes changing the data shown on the web pages bump the counter.
+    Web workers compare it once per request, which costs a single stat()
+    as long as it did not change, and drop their process-local caches
+    when it did.
+"""
+
+import os
+import fcntl
+import threading
+
+from flask import current_app
+
+
+class CacheGeneration(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stat = None
+        self._generation = None
+
+    def _fname(self):
+        return current_app.config['CACHE_GENERATION_FILE']
+
+    def _read(self, fname):
+        try:
+            with open(fname, 'r') as f:
+                return int(f.read().strip() or 0)
+        except (IOError, ValueError):
+            return 0
+
+    def bump(self):
+        """
+        Start a new cache generation.
+        """
+
+        fname = self._fname()
+        with self._lock, open(fname + ".lock", 'a') as lock_f:
+            # other processes bump it as well, the lock file keeps them from
+            # writing the same new generation
+            fcntl.flock(lock_f.fileno(), fcntl.LOCK_EX)
+            generation = self._read(fname) + 1
+            # the new file replaces the old one with a rename, so readers
+            # never see it half-written
+            tmp_fname = "%s.%i.new" % (fname, os.getpid())
+            with open(tmp_fname, 'w') as f:
+                f.write("%i\n" % (generation))
+            os.rename(tmp_fname, fname)
+
+    def changed(self):
+        """
+        Return True if the generation changed since the last call
+        in this process.
+        """
+
+        fname = self._fname()
+        try:
+            st = os.stat(fname)
+            stat = (st.st_ino, st.st_mtime, st.st_size)
+        except OSError:
+            stat = None
+
+        with self._lock:
+            if stat == self._stat:
+                return False
+            self._stat = stat
+            generation = self._read(fname) if stat else 0
+            if generation == self._generation:
+                return False
+            first_check = self._generation is None
+            self._generation = generation
+            # nothing was cached before the first check
+            return not first_check
+
+
+cache_generation = CacheGeneration()
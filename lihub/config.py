@@ -51,6 +51,13 @@ class BaseConfig(object):
 
     REPOS_ROOT_URL = "file://"+REPOS_ROOT
 
+    # Content-addressed package storage, repository pools hardlink into it.
+    # Should be on the same filesystem as REPOS_ROOT.
+    BLOBS_ROOT = os.path.join(INSTANCE_FOLDER_PATH, 'blobs')
+    make_dir(BLOBS_ROOT)
+    # seconds a blob no package refers to is kept, for imports still running
+    BLOB_GRACE = 3600
+
     FREEZER_IGNORE_404_NOT_FOUND=True
     FREEZER_RELATIVE_URLS=True
 
@@ -61,7 +68,19 @@ class BaseConfig(object):
     UPLOAD_FOLDER = os.path.join(INSTANCE_FOLDER_PATH, 'uploads')
     make_dir(UPLOAD_FOLDER)
 
+    # bumped whenever cached data of the web workers becomes outdated
+    CACHE_GENERATION_FILE = os.path.join(INSTANCE_FOLDER_PATH, 'cache-generation')
+
     PKG_INCOMING_DIR = os.path.join(INSTANCE_FOLDER_PATH, 'incoming')
+    # rejected uploads are moved here
+    PKG_MORGUE_DIR = os.path.join(INSTANCE_FOLDER_PATH, 'morgue')
+
+    # number of delta files kept next to each index, 0 disables them
+    INDEX_DIFF_HISTORY = 14
+    # seconds a replaced index generation is kept for clients still reading it
+    INDEX_GENERATION_GRACE = 3600
+    # additionally split the package index into shards by component ID prefix
+    INDEX_SHARDING = False
 
 
 class DefaultConfig(BaseConfig):
@@ -85,6 +104,8 @@ class DefaultConfig(BaseConfig):
     # Flask-cache: http://pythonhosted.org/Flask-Cache/
     CACHE_TYPE = 'simple'
     CACHE_DEFAULT_TIMEOUT = 60
+    # cached pages are invalidated on changes, this only limits their memory use
+    PAGE_CACHE_TIMEOUT = 3600
 
     # Flask-mail: http://pythonhosted.org/flask-mail/
     # https://bitbucket.org/danjac/flask-mail/issue/3/problem-with-gmails-smtp-server
@@ -19,30 +19,35 @@
 import os
 from uuid import uuid4
 
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import subqueryload
+
 from flask import (Blueprint, render_template, current_app, request,
-                   flash, url_for, redirect, session, abort)
+                   flash, url_for, redirect, session, abort, jsonify)
 from flask.ext.mail import Message
 from flask.ext.babel import gettext as _
 from flask.ext.login import login_required, login_user, current_user, logout_user, confirm_login, login_fresh
 
-from ..utils import build_cpt_path
+from ..utils import icon_path, ICON_SIZES
 from ..user import User, UserDetail
 from ..repository import Repository, Package, Component, Category
 from ..extensions import db, mail
-from ..admincp import GlobalSettings
+from ..refdata import refdata
+from ..pagecache import cached_page, software_page_tag, category_page_tag
+from ..search import component_search
+from ..autocomplete import component_completer, MAX_COMPLETIONS
 from .forms import SignupForm, LoginForm, RecoverPasswordForm, ReauthForm, ChangePasswordForm, CreateProfileForm
 
 
 frontend = Blueprint('frontend', __name__)
 
+# number of components shown on one page of a category
+CATEGORY_PAGE_SIZE = 48
+
 
 @frontend.context_processor
 def registration_allowed():
-    conf = GlobalSettings.query.first()
-    reg_allowed = False
-    if conf:
-        reg_allowed = conf.allow_registration
-    return dict(registration_allowed=reg_allowed)
+    return dict(registration_allowed=refdata.setting('allow_registration', False))
 
 
 @frontend.route('/create_profile', methods=['GET', 'POST'])
@@ -89,6 +94,29 @@ def search():
     return render_template('frontend/search.html', pagination=pagination, keywords=keywords)
 
 
+@frontend.route('/search/software')
+def search_software():
+    keywords = request.args.get('keywords', '').strip()
+    pagination = None
+    if keywords:
+        page = request.args.get('page', 1, type=int)
+        pagination = component_search.search(keywords, page, 20)
+    else:
+        flash(_('Please input keyword(s)'), 'error')
+    return render_template('frontend/search_software.html', active="software", pagination=pagination, keywords=keywords)
+
+
+@frontend.route('/search/autocomplete')
+def autocomplete():
+    prefix = request.args.get('q', '').strip()
+    limit = request.args.get('limit', MAX_COMPLETIONS, type=int)
+    completions = list()
+    if prefix and limit > 0:
+        completions = [dict(cid=c.cid, name=c.name, popularity=c.count)
+                       for c in component_completer.complete(prefix, limit)]
+    return jsonify(completions=completions)
+
+
 @frontend.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated():
@@ -143,11 +171,7 @@ def signup():
     if current_user.is_authenticated():
         return redirect(url_for('user.index'))
 
-    conf = GlobalSettings.query.first()
-    reg_allowed = False
-    if conf:
-        reg_allowed = conf.allow_registration
-    if not reg_allowed:
+    if not refdata.setting('allow_registration', False):
         return render_template('frontend/signup.html')
 
     form = SignupForm(next=request.args.get('next'))
@@ -230,45 +254,41 @@ def help():
     return render_template('frontend/footers/help.html', active="help")
 
 def get_icon_url_for_pkg(mrepo, pkg):
-    icon_url = url_for('static', filename='img/unknown-component.png')
-    if pkg:
-        icon_name = "%s-%s.png" % (pkg.name, pkg.version)
-
-        sizes = ["64x64", "128x128"]
-        for size in sizes:
-            icon_path = os.path.join("assets", build_cpt_path (pkg.name), pkg.version, "icons", size, icon_name)
-            print(os.path.join(mrepo.root_dir, icon_path))
-            if os.path.isfile(os.path.join(mrepo.root_dir, icon_path)):
-                icon_url = mrepo.data_url_for(icon_path)
-                break
-    return icon_url
+    # the icon sizes are recorded by the importer, no need to look at the disk
+    if pkg and pkg.icon_sizes:
+        sizes = pkg.icon_sizes.split(",")
+        for size in ICON_SIZES:
+            if size in sizes:
+                return mrepo.data_url_for(icon_path(pkg.name, pkg.version, size))
+    return url_for('static', filename='img/unknown-component.png')
 
 @frontend.route('/software/<cpt_id>')
+@cached_page(lambda cpt_id: software_page_tag(cpt_id))
 def software_page(cpt_id):
     # only the master repository is queried here
-    mrepo = Repository.query.filter_by(name="master").one()
+    mrepo = refdata.repository("master")
 
-    cpt = Component.query.filter_by(repository=mrepo, cid=cpt_id).first()
+    cpt = Component.query.filter_by(repository_id=mrepo.id, cid=cpt_id).first()
     if cpt.sdk:
         # get the runtime component for this development cpt
         cpt_sdk = cpt
         if cpt_id.endswith(".sdk"):
             cpt_id_rt = cpt_id[:-4]
-            cpt = Component.query.filter_by(repository=mrepo, cid=cpt_id_rt).first()
+            cpt = Component.query.filter_by(repository_id=mrepo.id, cid=cpt_id_rt).first()
         else:
             cpt = None
     else:
         # get the SDK component
         cpt_id_sdk = "%s.sdk" % (cpt_id)
-        cpt_sdk = Component.query.filter_by(repository=mrepo, cid=cpt_id_sdk).first()
+        cpt_sdk = Component.query.filter_by(repository_id=mrepo.id, cid=cpt_id_sdk).first()
 
     packages = None
     packages_sdk = None
 
     if cpt:
-        packages = Package.query.filter_by(repository=mrepo, component=cpt)
+        packages = Package.query.filter_by(repository_id=mrepo.id, component=cpt)
     if cpt_sdk:
-        packages_sdk = Package.query.filter_by(repository=mrepo, component=cpt_sdk)
+        packages_sdk = Package.query.filter_by(repository_id=mrepo.id, component=cpt_sdk)
 
     icon_url = get_icon_url_for_pkg(mrepo, packages[0])
 
@@ -276,37 +296,59 @@ def software_page(cpt_id):
                            packages_sdk=packages_sdk, cpt_sdk=cpt_sdk, icon_url=icon_url)
 
 @frontend.route('/browse')
+@cached_page(lambda: "browse")
 def browse():
-    categories = Category.query.filter_by(parent=None)
+    categories = refdata.toplevel_categories()
 
     return render_template('frontend/browse.html', active="browse", categories=categories)
 
 
 @frontend.route('/browse/<main_category>')
 @frontend.route('/browse/<main_category>/<sub_category>')
+@cached_page(lambda main_category, sub_category=None: category_page_tag(sub_category or main_category))
 def browse_category(main_category, sub_category=None):
     # only the master repository is queried here
-    mrepo = Repository.query.filter_by(name="master").one()
+    mrepo = refdata.repository("master")
 
-    cat = Category.query.filter_by(idname=main_category).first()
+    cat = refdata.category(main_category)
     if not cat:
         abort(404)
 
     category_id = main_category
     subcats = None
     if sub_category:
-        subcat = Category.query.filter_by(idname=sub_category).first()
+        subcat = refdata.category(sub_category)
         if not subcat:
             abort(404)
-        if subcat.parent != cat:
+        if subcat.parent is not cat:
             abort(404)
         cat = subcat
         category_id = sub_category
     else:
         subcats = cat.subcategories
 
-    components = Component.query.filter(Component.repository==mrepo).filter(
+    components = Component.query.filter(Component.repository_id==mrepo.id).filter(
                                     Component.categories.any(Category.idname.in_([category_id]))).filter(Component.sdk==False)
 
+    # seek to the component after the last one of the previous page, which
+    # is found by an index lookup however deep into the category we are
+    after = request.args.get('after', '')
+    if after:
+        after_id, sep, after_name = after.partition(":")
+        if not sep or not after_id.isdigit():
+            abort(404)
+        components = components.filter(or_(Component.name > after_name,
+                                           and_(Component.name == after_name, Component.id > int(after_id))))
+
+    components = components.order_by(Component.name, Component.id) \
+                           .options(subqueryload(Component.packages)) \
+                           .limit(CATEGORY_PAGE_SIZE + 1).all()
+
+    next_after = None
+    if len(components) > CATEGORY_PAGE_SIZE:
+        components = components[:CATEGORY_PAGE_SIZE]
+        next_after = "%i:%s" % (components[-1].id, components[-1].name)
+
     current_app.jinja_env.globals.update(get_icon_url_for_pkg=get_icon_url_for_pkg)
-    return render_template('frontend/category.html', active="browse", category=cat, subcategories=subcats, components=components, repo=mrepo)
+    return render_template('frontend/category.html', active="browse", category=cat, subcategories=subcats,
+                           components=components, repo=mrepo, after=after, next_after=next_after)
@@ -1 +1,4 @@
- 
+# -*- coding: utf-8 -*-
+
+from .models import SignatureCheck, ImportJournalEntry, ImportRun
+from .constants import ImportState
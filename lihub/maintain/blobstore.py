@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public  License
+# as published by the Free Software Foundation; either version
+# 3.0 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.
+
+import os
+import time
+import errno
+import shutil
+import tempfile
+from hashlib import sha256
+
+# read files in chunks of this size, so memory usage does not
+# depend on the package size
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# ioctl request to clone a file's extents (Linux, btrfs/XFS)
+FICLONE = 0x40049409
+
+
+class BlobValidationError(Exception):
+    pass
+
+
+def _reflink_or_copy(src, dest):
+    try:
+        import fcntl
+        with open(src, 'rb') as fsrc, open(dest, 'wb') as fdest:
+            fcntl.ioctl(fdest.fileno(), FICLONE, fsrc.fileno())
+    except (IOError, OSError, ImportError):
+        shutil.copyfile(src, dest)
+
+
+class BlobStore():
+    """
+    Content-addressed storage for package payloads.
+
+    Every file is stored exactly once, keyed by its SHA-256 checksum.
+    Repository pool files are hardlinks (or reflinks, if hardlinking is
+    not possible) to the blobs, so the same package in several repositories
+    does not take up additional disk space.
+    The store should live on the same filesystem as the repositories.
+    """
+
+    def __init__(self, root):
+        self._root = root
+        self.bytes_hashed = 0
+
+
+    def path_for(self, sha256sum):
+        return os.path.join(self._root, sha256sum[:2], sha256sum)
+
+
+    def has(self, sha256sum):
+        return os.path.isfile(self.path_for(sha256sum))
+
+
+    def add_file(self, src_fname, sha256sum, size=None):
+        """
+        Add a file to the store, verifying its size and checksum.
+
+        If the blob is already known, the file is not read at all. If the
+        file is on the same filesystem as the store, it is hashed in place
+        and renamed into the store, otherwise it is hashed while being copied.
+        Returns the path of the blob.
+        Raises BlobValidationError if size or checksum do not match.
+        """
+
+        blob_fname = self.path_for(sha256sum)
+        if os.path.isfile(blob_fname):
+            return blob_fname
+
+        fname = os.path.basename(src_fname)
+        st = os.stat(src_fname)
+        if size is not None and st.st_size != size:
+            raise BlobValidationError("Size mismatch for '%s'" % (fname))
+
+        blob_dir = os.path.dirname(blob_fname)
+        if not os.path.exists(blob_dir):
+            os.makedirs(blob_dir)
+
+        h = sha256()
+        if st.st_dev == os.stat(blob_dir).st_dev:
+            with open(src_fname, 'rb') as src:
+                self._read_chunks(src, h)
+            if h.hexdigest() != sha256sum:
+                raise BlobValidationError("Checksum mismatch for '%s'" % (fname))
+            os.rename(src_fname, blob_fname)
+        else:
+            fd, tmp_fname = tempfile.mkstemp(prefix=".import-", dir=blob_dir)
+            try:
+                with open(src_fname, 'rb') as src, os.fdopen(fd, 'wb') as dest:
+                    self._read_chunks(src, h, dest)
+                if h.hexdigest() != sha256sum:
+                    raise BlobValidationError("Checksum mismatch for '%s'" % (fname))
+                os.rename(tmp_fname, blob_fname)
+            finally:
+                if os.path.exists(tmp_fname):
+                    os.remove(tmp_fname)
+
+        # blobs are shared between repositories, no one should modify them
+        os.chmod(blob_fname, 0o444)
+        return blob_fname
+
+
+    def _read_chunks(self, src, h, dest=None):
+        while True:
+            chunk = src.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+            self.bytes_hashed += len(chunk)
+            if dest:
+                dest.write(chunk)
+
+
+    def link_to(self, sha256sum, dest_fname):
+        """
+        Make dest_fname refer to the blob, replacing it atomically if it exists.
+        """
+
+        blob_fname = self.path_for(sha256sum)
+        if os.path.exists(dest_fname) and os.path.samefile(blob_fname, dest_fname):
+            return
+
+        dest_dir = os.path.dirname(dest_fname)
+        if not os.path.exists(dest_dir):
+            os.makedirs(dest_dir)
+
+        tmp_fname = os.path.join(dest_dir, ".%s.new" % (os.path.basename(dest_fname)))
+        if os.path.lexists(tmp_fname):
+            os.remove(tmp_fname)
+        try:
+            os.link(blob_fname, tmp_fname)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+            _reflink_or_copy(blob_fname, tmp_fname)
+        os.rename(tmp_fname, dest_fname)
+
+
+    def remove_unreferenced(self, referenced, grace):
+        """
+        Remove all blobs whose checksum is not in referenced.
+
+        Importers add blobs before the packages referencing them are
+        committed, so blobs added less than grace seconds ago are kept.
+        Returns the number of removed blobs.
+        """
+
+        removed = 0
+        now = time.time()
+        for dirpath, dirnames, filenames in os.walk(self._root):
+            for fname in filenames:
+                # temporary files of running imports
+                if fname.startswith("."):
+                    continue
+                if fname in referenced:
+                    continue
+                blob_fname = os.path.join(dirpath, fname)
+                # renaming and linking a blob update its ctime, unlike its mtime
+                try:
+                    if now - os.stat(blob_fname).st_ctime < grace:
+                        continue
+                    os.remove(blob_fname)
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+                    continue
+                removed += 1
+        return removed
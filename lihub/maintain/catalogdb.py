@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public  License
+# as published by the Free Software Foundation; either version
+# 3.0 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.
+
+import os
+import sqlite3
+
+CATALOG_NAME = "Catalog.db"
+# bump whenever the schema changes
+CATALOG_FORMAT_VERSION = 1
+
+CATALOG_SCHEMA = """
+CREATE TABLE packages (
+    name TEXT NOT NULL,
+    version TEXT NOT NULL,
+    cid TEXT NOT NULL,
+    cpt_name TEXT NOT NULL,
+    fname TEXT NOT NULL,
+    sha256sum TEXT NOT NULL,
+    dependencies TEXT
+);
+CREATE TABLE categories (
+    cid TEXT NOT NULL,
+    category TEXT NOT NULL
+);
+"""
+
+# indices are created after all rows are in, which is a lot faster
+CATALOG_INDICES = """
+CREATE INDEX packages_name ON packages (name, version);
+CREATE INDEX packages_cid ON packages (cid);
+CREATE INDEX categories_cid ON categories (cid);
+CREATE INDEX categories_category ON categories (category);
+"""
+
+
+class CatalogWriter():
+    """
+    Write the SQLite catalog of one architecture of a repository.
+
+    The catalog lists packages with versions, dependencies and checksums,
+    and the categories of their components. Clients open it read-only and
+    answer lookups with indexed queries, without parsing the indices.
+    The file is written under a temporary name and renamed into place
+    by close().
+    """
+
+    def __init__(self, fname):
+        self._fname = fname
+        if os.path.isfile(fname+".new"):
+            os.remove(fname+".new")
+        self._conn = sqlite3.connect(fname+".new")
+        self._conn.execute("PRAGMA journal_mode = OFF")
+        self._conn.execute("PRAGMA synchronous = OFF")
+        self._conn.execute("PRAGMA user_version = %i" % (CATALOG_FORMAT_VERSION))
+        self._conn.executescript(CATALOG_SCHEMA)
+
+    def add_package(self, row):
+        self._conn.execute("INSERT INTO packages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                           (row.name, row.version, row.cid, row.cpt_name,
+                            row.fname, row.sha256sum, row.dependencies))
+
+    def add_categories(self, pairs):
+        self._conn.executemany("INSERT INTO categories VALUES (?, ?)", pairs)
+
+    def close(self):
+        self._conn.executescript(CATALOG_INDICES)
+        self._conn.commit()
+        self._conn.execute("VACUUM")
+        self._conn.close()
+        os.rename(self._fname+".new", self._fname)
+
+    def abort(self):
+        self._conn.close()
+        os.remove(self._fname+".new")
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public  License
+# as published by the Free Software Foundation; either version
+# 3.0 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.
+
+import os
+import glob
+import errno
+import time
+import socket
+import shutil
+
+from ..repository.models import Package
+from ..refdata import refdata
+from ..utils import make_dir
+from .dscfile import DSCFile, DscFileException
+from .models import ImportJournalEntry
+from .constants import ImportState
+
+# claims of workers on other machines are considered abandoned if they
+# were not touched for this many seconds
+CLAIM_TIMEOUT = 60 * 60
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+class WorkClaims():
+    """
+    Lets several importers share one incoming directory.
+
+    An upload is claimed by atomically renaming its DSC file into a claim
+    directory owned by the current worker; only one worker can win that
+    rename. The files referenced by the DSC follow it. Claims of crashed
+    workers are moved back to the incoming directory.
+    The claim directories live inside the incoming directory, so all
+    renames stay on one filesystem.
+    """
+
+    def __init__(self, incoming_dir, morgue_dir, blobs=None):
+        self._incoming_dir = incoming_dir
+        self._morgue_dir = morgue_dir
+        self._blobs = blobs
+        self._claims_root = os.path.join(incoming_dir, ".claims")
+        self._hostname = socket.gethostname()
+        self.worker_id = "%s-%d" % (self._hostname, os.getpid())
+        self.claim_dir = os.path.join(self._claims_root, self.worker_id)
+
+
+    def _move_files(self, dscfile, src_dir, dest_dir, from_blobs=False):
+        dsc = DSCFile()
+        dsc.open(dscfile)
+        for sha256sum, size, fname in dsc.get_file_entries():
+            try:
+                os.rename(os.path.join(src_dir, fname), os.path.join(dest_dir, fname))
+            except OSError as e:
+                # the payload might already have been moved into the blob store
+                if e.errno != errno.ENOENT:
+                    raise
+                if from_blobs and self._blobs and self._blobs.has(sha256sum):
+                    self._blobs.link_to(sha256sum, os.path.join(dest_dir, fname))
+
+
+    def claim(self, dscfile):
+        """
+        Claim an upload for this worker.
+
+        Returns the path of the claimed DSC file, or None if another
+        worker was faster.
+        """
+
+        # the file names are used below, so they have to be valid
+        dsc = DSCFile()
+        try:
+            dsc.open(dscfile)
+            dsc.get_file_entries()
+        except (IOError, OSError, DscFileException):
+            return None
+
+        make_dir(self.claim_dir)
+        claimed_dsc = os.path.join(self.claim_dir, os.path.basename(dscfile))
+        try:
+            os.rename(dscfile, claimed_dsc)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+
+        self._move_files(claimed_dsc, os.path.dirname(dscfile), self.claim_dir)
+        # the modification time of the claim directory is our heartbeat
+        os.utime(self.claim_dir, None)
+        return claimed_dsc
+
+
+    def heartbeat(self):
+        """
+        Mark the claims of this worker as alive. Must be called more often
+        than every CLAIM_TIMEOUT seconds while claims are held.
+        """
+
+        if os.path.isdir(self.claim_dir):
+            os.utime(self.claim_dir, None)
+
+
+    def _finish(self, claimed_dsc, dest_dir):
+        if dest_dir:
+            make_dir(dest_dir)
+            # rejected uploads keep their payloads, even those already in the blob store
+            self._move_files(claimed_dsc, self.claim_dir, dest_dir, from_blobs=True)
+            os.rename(claimed_dsc, os.path.join(dest_dir, os.path.basename(claimed_dsc)))
+            return
+
+        dsc = DSCFile()
+        dsc.open(claimed_dsc)
+        for sha256sum, size, fname in dsc.get_file_entries():
+            fname_full = os.path.join(self.claim_dir, fname)
+            if os.path.isfile(fname_full):
+                os.remove(fname_full)
+        os.remove(claimed_dsc)
+
+
+    def done(self, claimed_dsc):
+        """
+        Remove an upload which was imported successfully.
+        """
+        self._finish(claimed_dsc, None)
+
+
+    def reject(self, claimed_dsc):
+        """
+        Move a rejected upload to the morgue.
+        """
+        self._finish(claimed_dsc, self._morgue_dir)
+
+
+    def reject_invalid(self, dscfile):
+        """
+        Move a DSC whose file list can not be used to the morgue, without
+        touching any of the files it names.
+        Returns False if another worker was faster.
+        """
+
+        make_dir(self._morgue_dir)
+        try:
+            os.rename(dscfile, os.path.join(self._morgue_dir, os.path.basename(dscfile)))
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return False
+            raise
+        return True
+
+
+    def _return(self, dscfile):
+        self._move_files(dscfile, os.path.dirname(dscfile), self._incoming_dir)
+        os.rename(dscfile, os.path.join(self._incoming_dir, os.path.basename(dscfile)))
+
+
+    def release(self, claimed_dsc):
+        """
+        Return an upload to the incoming directory, to be claimed again later.
+        """
+        self._return(claimed_dsc)
+
+
+    def release_all(self):
+        """
+        Return all uploads claimed by this worker to the incoming directory.
+        """
+
+        if not os.path.isdir(self.claim_dir):
+            return
+        for fname in os.listdir(self.claim_dir):
+            if fname.endswith(".dsc"):
+                self._return(os.path.join(self.claim_dir, fname))
+
+
+    def referenced_payloads(self):
+        """
+        Return the checksums of all files named by DSCs waiting in the
+        incoming directory, held in claims or kept in the morgue.
+        """
+
+        # uploads move between these directories while we look, in the
+        # order incoming -> claims -> incoming or morgue, so the claims are
+        # looked at before and after the incoming directory
+        patterns = [os.path.join(self._claims_root, "*", "*.dsc"),
+                    os.path.join(self._incoming_dir, "*.dsc"),
+                    os.path.join(self._claims_root, "*", "*.dsc"),
+                    os.path.join(self._morgue_dir, "*.dsc")]
+
+        checksums = set()
+        for pattern in patterns:
+            for dscfile in glob.glob(pattern):
+                dsc = DSCFile()
+                try:
+                    dsc.open(dscfile)
+                    entries = dsc.get_file_entries()
+                except (IOError, OSError, DscFileException):
+                    # moved on meanwhile, or of no use anyway
+                    continue
+                checksums.update([sha256sum for sha256sum, size, fname in entries])
+        return checksums
+
+
+    def _is_stale(self, worker_id, path):
+        if worker_id == self.worker_id:
+            return False
+        host, sep, pid = worker_id.rpartition("-")
+        if host == self._hostname and pid.isdigit():
+            return not _pid_alive(int(pid))
+        try:
+            return time.time() - os.path.getmtime(path) > CLAIM_TIMEOUT
+        except OSError:
+            return False
+
+
+    def _is_imported(self, dscfile):
+        dsc = DSCFile()
+        dsc.open(dscfile)
+        if ImportJournalEntry.query.filter_by(dsc_sha256=dsc.sha256sum, state=ImportState.IMPORTED).first():
+            return True
+
+        repo = refdata.repository(dsc.get_val('Target'))
+        entries = dsc.get_file_entries()
+        if not repo or not entries:
+            return False
+        for sha256sum, size, fname in entries:
+            if not Package.query.filter_by(repository_id=repo.id, sha256sum=sha256sum).first():
+                return False
+        return True
+
+
+    def recover_stale(self):
+        """
+        Return the uploads claimed by crashed workers to the incoming directory.
+
+        Uploads which were already imported before the worker crashed are
+        removed instead, so they are not imported a second time.
+        """
+
+        if not os.path.isdir(self._claims_root):
+            return
+
+        for dirname in os.listdir(self._claims_root):
+            path = os.path.join(self._claims_root, dirname)
+            # a recovery can itself be abandoned by a crashed worker
+            worker_id, sep, recovering_id = dirname.partition(".recovering-")
+            if not self._is_stale(recovering_id or worker_id, path):
+                continue
+
+            # only one worker can win this rename, so a claim is never
+            # recovered twice
+            recover_dir = os.path.join(self._claims_root, "%s.recovering-%s" % (worker_id, self.worker_id))
+            try:
+                os.rename(path, recover_dir)
+            except OSError:
+                continue
+
+            for fname in os.listdir(recover_dir):
+                if not fname.endswith(".dsc"):
+                    continue
+                dscfile = os.path.join(recover_dir, fname)
+                if self._is_imported(dscfile):
+                    continue
+                self._return(dscfile)
+            shutil.rmtree(recover_dir)
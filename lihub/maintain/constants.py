@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+
+class ImportState:
+    PENDING = 0
+    IMPORTED = 1
+    REJECTED = 2
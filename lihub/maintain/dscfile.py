@@ -16,9 +16,29 @@
 # License along with this program.
 
 import os
+import time
+from hashlib import sha256
+
 from ..utils import run_command
 
 
+# seconds a file without a stated size has to stay unmodified before its
+# upload is considered complete
+UPLOAD_SETTLE_TIME = 30
+
+
+def still_written(fname):
+    """
+    Return True if fname was modified too recently to be sure its upload
+    is complete.
+    """
+
+    try:
+        return time.time() - os.path.getmtime(fname) < UPLOAD_SETTLE_TIME
+    except OSError:
+        return False
+
+
 class DscFileException(Exception):
     pass
 
@@ -27,12 +47,14 @@ class DSCFile:
     def __init__(self):
         self.content = dict()
         self.fname = ""
+        self.sha256sum = None
 
     def open(self, fname):
         with open(fname) as f:
             lines = f.readlines()
 
         self.fname = fname
+        self.sha256sum = sha256("".join(lines)).hexdigest()
 
         # we are really relaxed about the file format here, as long as we can
         # get data out, it's fine
@@ -62,15 +84,74 @@ class DSCFile:
         return self.content.get(key)
 
 
-    def get_files(self):
+    def get_file_entries(self):
+        """
+        Return a list of (sha256sum, size, fname) tuples for the files
+        listed in the DSC. The size is None if the DSC does not state it.
+        Raises DscFileException if a file name is not a plain file name.
+        """
+
         files_raw = self.get_val("Files")
-        files = dict()
+        entries = list()
+        if not files_raw:
+            return entries
 
         for line in files_raw.split("\n"):
-            if not ' ' in line:
+            parts = line.split()
+            if len(parts) == 2:
+                entry = (parts[0], None, parts[1])
+            elif len(parts) >= 3:
+                try:
+                    size = int(parts[1])
+                except ValueError:
+                    raise DscFileException("Invalid file size for '%s'" % (parts[2]))
+                entry = (parts[0], size, parts[2])
+            else:
                 continue
-            parts = line.split(" ", 2)
-            files[parts[0].strip()] = parts[1].strip()
+            # the names are joined to the upload directory, before the
+            # signature was checked
+            fname = entry[2]
+            if os.path.basename(fname) != fname or fname in (".", ".."):
+                raise DscFileException("Invalid file name '%s'" % (fname))
+            entries.append(entry)
+        return entries
+
+
+    def files_complete(self, directory, known=None):
+        """
+        Check whether all files referenced by the DSC are present in
+        directory, and have at least their stated size. Files without a
+        stated size must not have been modified for UPLOAD_SETTLE_TIME
+        seconds.
+        known can be a function telling whether a payload with a given
+        checksum is already available elsewhere.
+        """
+
+        try:
+            entries = self.get_file_entries()
+        except DscFileException:
+            return False
+        if not entries:
+            return False
+
+        for sha256sum, size, fname in entries:
+            try:
+                st = os.stat(os.path.join(directory, fname))
+            except OSError:
+                if known and known(sha256sum):
+                    continue
+                return False
+            if size is not None and st.st_size < size:
+                return False
+            if size is None and time.time() - st.st_mtime < UPLOAD_SETTLE_TIME:
+                return False
+        return True
+
+
+    def get_files(self):
+        files = dict()
+        for sha256sum, size, fname in self.get_file_entries():
+            files[sha256sum] = fname
         return files
 
 
@@ -91,21 +172,30 @@ class DSCFile:
             raise DscFileException(
                 "Unknown problem while verifying signature")
 
-        if gpg_output.count('[GNUPG:] GOODSIG'):
-            pass
-        elif gpg_output.count('[GNUPG:] BADSIG'):
-            raise DscFileException("Bad signature")
-        elif gpg_output.count('[GNUPG:] ERRSIG'):
-            raise DscFileException("Error verifying signature")
-        elif gpg_output.count('[GNUPG:] NODATA'):
-            raise DscFileException("No signature on")
-        else:
-            raise DscFileException(
-                "Unknown problem while verifying signature"
-            )
-
-        key = None
-        for line in gpg_output.split("\n"):
-            if line.startswith('[GNUPG:] VALIDSIG'):
-                key = line.split()[2]
-        return key
+        return parse_gpg_verify_status(gpg_output)
+
+
+def parse_gpg_verify_status(gpg_output):
+    """
+    Check the status output of a single "gpg --verify" run and return the
+    fingerprint of the signing key.
+    """
+
+    if gpg_output.count('[GNUPG:] GOODSIG'):
+        pass
+    elif gpg_output.count('[GNUPG:] BADSIG'):
+        raise DscFileException("Bad signature")
+    elif gpg_output.count('[GNUPG:] ERRSIG'):
+        raise DscFileException("Error verifying signature")
+    elif gpg_output.count('[GNUPG:] NODATA'):
+        raise DscFileException("No signature on")
+    else:
+        raise DscFileException(
+            "Unknown problem while verifying signature"
+        )
+
+    key = None
+    for line in gpg_output.split("\n"):
+        if line.startswith('[GNUPG:] VALIDSIG'):
+            key = line.split()[2]
+    return key
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public  License
+# as published by the Free Software Foundation; either version
+# 3.0 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.
+
+"""
+    Generation-based publishing of repository indices.
+
+    The indices of a repository are built into a new directory below
+    <repo>/generations/, which starts out as a hardlinked copy of the
+    current one. <repo>/indices is a symlink to the published generation
+    and is replaced with a single rename, so clients always see a complete
+    and consistent set of index files.
+"""
+
+import os
+import time
+import fcntl
+import errno
+import shutil
+
+GENERATIONS_DIR = "generations"
+INDICES_LINK = "indices"
+LOCK_FILE = ".lock"
+
+
+def lock_generations(root_dir):
+    """
+    Wait for the exclusive build lock of a repository, and return a file
+    object which holds it until it is closed.
+
+    Builders which started from the same generation would otherwise
+    publish without the architectures the other one built.
+    """
+
+    gens_dir = os.path.join(root_dir, GENERATIONS_DIR)
+    if not os.path.exists(gens_dir):
+        try:
+            os.makedirs(gens_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+    lock_f = open(os.path.join(gens_dir, LOCK_FILE), 'a')
+    fcntl.flock(lock_f.fileno(), fcntl.LOCK_EX)
+    return lock_f
+
+
+def _generation_numbers(gens_dir):
+    if not os.path.isdir(gens_dir):
+        return list()
+    return sorted([int(name) for name in os.listdir(gens_dir) if name.isdigit()])
+
+
+def current_generation(root_dir):
+    """
+    Return the directory of the published generation, or None.
+    """
+
+    link = os.path.join(root_dir, INDICES_LINK)
+    if not os.path.islink(link):
+        return None
+    return os.path.join(root_dir, os.readlink(link))
+
+
+def _reserve_generation(gens_dir):
+    """
+    Create the directory of the next generation and return it. Several
+    index builds may run at once, so the directory is created exclusively
+    and the next number is tried if another process took this one.
+    """
+
+    if not os.path.exists(gens_dir):
+        try:
+            os.makedirs(gens_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+    while True:
+        numbers = _generation_numbers(gens_dir)
+        gen_dir = os.path.join(gens_dir, str(numbers[-1] + 1 if numbers else 1))
+        try:
+            os.mkdir(gen_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+            continue
+        return gen_dir
+
+
+def _link_tree(src, dest):
+    for dirpath, dirnames, filenames in os.walk(src):
+        target = os.path.join(dest, os.path.relpath(dirpath, src))
+        if not os.path.isdir(target):
+            os.makedirs(target)
+        for fname in filenames:
+            os.link(os.path.join(dirpath, fname), os.path.join(target, fname))
+
+
+def _adopt_indices_dir(root_dir):
+    """
+    Move an indices directory written before generations existed into
+    the first generation and publish it.
+    """
+
+    indices = os.path.join(root_dir, INDICES_LINK)
+    if os.path.islink(indices) or not os.path.isdir(indices):
+        return
+    gen_dir = _reserve_generation(os.path.join(root_dir, GENERATIONS_DIR))
+    try:
+        # replaces the empty directory
+        os.rename(indices, gen_dir)
+    except OSError as e:
+        os.rmdir(gen_dir)
+        # another process adopted it first
+        if e.errno == errno.ENOENT:
+            return
+        raise
+    publish_generation(root_dir, gen_dir)
+
+
+def begin_generation(root_dir):
+    """
+    Create the directory of a new generation, holding hardlinks to all
+    files of the published one. Files in it must only ever be replaced
+    by renaming over them, never modified in place.
+    """
+
+    _adopt_indices_dir(root_dir)
+
+    gen_dir = _reserve_generation(os.path.join(root_dir, GENERATIONS_DIR))
+    current = current_generation(root_dir)
+    if current and os.path.isdir(current):
+        _link_tree(current, gen_dir)
+    return gen_dir
+
+
+def publish_generation(root_dir, gen_dir):
+    """
+    Point the indices symlink of a repository to gen_dir atomically.
+    """
+
+    link = os.path.join(root_dir, INDICES_LINK)
+    tmp_link = "%s.%i.new" % (link, os.getpid())
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(os.path.relpath(gen_dir, root_dir), tmp_link)
+    os.rename(tmp_link, link)
+
+
+def prune_generations(root_dir, grace):
+    """
+    Remove generations which were replaced more than grace seconds ago,
+    and unpublished ones which were abandoned for as long.
+    """
+
+    gens_dir = os.path.join(root_dir, GENERATIONS_DIR)
+    current = current_generation(root_dir)
+    if not current:
+        return
+    current_number = int(os.path.basename(current))
+
+    now = time.time()
+    numbers = _generation_numbers(gens_dir)
+    for i, number in enumerate(numbers):
+        if number == current_number:
+            continue
+        if number < current_number:
+            # a generation was replaced when its successor was built
+            since = os.path.getmtime(os.path.join(gens_dir, str(numbers[i + 1])))
+        else:
+            since = os.path.getmtime(os.path.join(gens_dir, str(number)))
+        if now - since > grace:
+            shutil.rmtree(os.path.join(gens_dir, str(number)))
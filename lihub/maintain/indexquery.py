@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public  License
+# as published by the Free Software Foundation; either version
+# 3.0 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.
+
+from sqlalchemy import case
+from ..repository.models import Package, Component, Category, component_categories
+from ..extensions import db
+
+# number of rows fetched from the database at once
+INDEX_QUERY_CHUNK_SIZE = 500
+
+
+def iter_index_rows(repo_id, arch, chunk_size=INDEX_QUERY_CHUNK_SIZE):
+    """
+    Yield everything the index builder needs for the packages of one
+    architecture of a repository, in a stable order.
+
+    This is a single joined query whose rows are streamed in chunks, so
+    neither the number of queries nor memory usage grow with the number
+    of packages. The full component XML is only fetched for components
+    which have no stored distro XML fragment yet.
+    """
+
+    xml = case([(Component.xml_fragment == None, Component.xml)], else_=None)
+    query = db.session.query(Package.name,
+                             Package.version,
+                             Package.sha256sum,
+                             Package.fname,
+                             Package.dependencies,
+                             Component.cid,
+                             Component.name.label('cpt_name'),
+                             Component.xml_fragment,
+                             xml.label('xml')) \
+                      .join(Component, Package.component_id == Component.id) \
+                      .filter(Package.repository_id == repo_id,
+                              Package.architecture == arch,
+                              Component.xml != '') \
+                      .order_by(Package.name, Package.version, Package.id)
+    return query.execution_options(stream_results=True).yield_per(chunk_size)
+
+
+def iter_index_categories(repo_id, arch):
+    """
+    Yield (component ID, category ID name) pairs of the components which
+    have packages in one architecture of a repository.
+    """
+
+    query = db.session.query(Component.cid, Category.idname) \
+                      .join(Package, Package.component_id == Component.id) \
+                      .join(component_categories, component_categories.c.component_id == Component.id) \
+                      .join(Category, component_categories.c.category_id == Category.id) \
+                      .filter(Package.repository_id == repo_id,
+                              Package.architecture == arch) \
+                      .distinct() \
+                      .order_by(Component.cid, Category.idname)
+    return query
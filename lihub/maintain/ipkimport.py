@@ -17,194 +17,630 @@
 
 import os
 import glob
-import shutil
 import re
+import shutil
+import multiprocessing
 import gi
 gi.require_version('Limba', '1.0')
 gi.require_version('AppStream', '1.0')
 from gi.repository import Limba
 from gi.repository import AppStream
-from hashlib import sha256
 
-from ..utils import build_cpt_path
+from flask import current_app
+
+from ..utils import build_cpt_path, find_icon_sizes, xml_fragment
 from ..repository.models import *
 from ..user import User
 from ..extensions import db
+from ..refdata import refdata
+from ..newrows import NewRowTracker
+from ..pagecache import invalidate_pages, software_page_tag, category_page_tag
+from ..cachegen import cache_generation
 from ..utils import get_current_time
-from .dscfile import DSCFile
+from .dscfile import DSCFile, DscFileException, still_written
+from .blobstore import BlobStore, BlobValidationError
+from .sigverify import SignatureVerifier
+from .claims import WorkClaims
+from .models import ImportJournalEntry
+from .constants import ImportState
+from .stats import ImportStats
 
+# number of uploads imported per database transaction
+COMMIT_INTERVAL = 50
+# number of uploads claimed at once, the rest is left to other importers
+CLAIM_BATCH_SIZE = 100
 
-class IPKImporter():
-    def __init__(self, search_dir):
-        self._import_dir = search_dir
-        self._asmdata = AppStream.Metadata()
-        self._asmdata.set_locale("C")
-
-        self._xdg_cat_map = { 'AudioVideo': self._category_by_id("multimedia"),
-                        'Audio': self._category_by_id("multimedia"),
-                        'Video': self._category_by_id("multimedia"),
-                        'Development': self._category_by_id("development"),
-                        'Education': self._category_by_id("education"),
-                        'Game': self._category_by_id("games"),
-                        'Graphics': self._category_by_id("graphics"),
-                        'Network': self._category_by_id("network"),
-                        'Office': self._category_by_id("customization"),
-                        'Science': self._category_by_id("science"),
-                        'Settings': self._category_by_id("tools"),
-                        'System': self._category_by_id("system"),
-                        'Utility': self._category_by_id("tools"),
-
-                        'Arcade': self._category_by_id("arcade")
-                      }
 
+class ImportRejected(Exception):
+    pass
 
-    def _category_by_id(self, cat_name):
-        return Category.query.filter_by(idname=cat_name).one()
 
+# AppStream metadata parser, created once per (worker) process
+_asmdata = None
 
-    def _map_categories(self, cpt):
-        xdg_cats = cpt.get_categories()
-        if cpt.get_kind() != AppStream.ComponentKind.DESKTOP:
-            return [Category.query.filter_by(idname="components").one()]
-        if not xdg_cats:
-            return [Category.query.filter_by(idname="other").one()]
+def _get_asmdata():
+    global _asmdata
+    if not _asmdata:
+        _asmdata = AppStream.Metadata()
+        _asmdata.set_locale("C")
+    return _asmdata
 
-        cats = list()
-        for xcat in xdg_cats:
-            cat = self._xdg_cat_map.get(xcat)
-            if cat:
-                cats.append(cat)
-        if len(cats) == 0:
-            return [Category.query.filter_by(idname="other").one()]
 
-        return cats
+def _place_package(blobs, sha256sum, repo_root, stats):
+    """
+    Parse a verified IPK package and place it and its icons in the repository.
 
+    This step does not touch the database, so it can run in a worker process.
+    Returns a dict with everything the database stage needs.
+    """
 
-    def _import_package(self, pkg_fname, sha256sum, dsc):
+    with stats.stage('open'):
         pkg = Limba.Package()
-        pkg.open_file(pkg_fname)
+        pkg.open_file(blobs.path_for(sha256sum))
 
         if pkg.has_embedded_packages():
-            self._reject_dsc("Package contains embedded packages. This is not allowed in repositories.", dsc)
-            return
+            raise ImportRejected("Package contains embedded packages. This is not allowed in repositories.")
 
         pki = pkg.get_info()
 
         cpt_xml = pkg.get_appstream_data()
 
-        self._asmdata.clear_components()
-        self._asmdata.parse_data(cpt_xml)
-        cpt = self._asmdata.get_component()
+        asmdata = _get_asmdata()
+        asmdata.clear_components()
+        asmdata.parse_data(cpt_xml)
+        cpt = asmdata.get_component()
+        cpt_fragment = xml_fragment(asmdata.components_to_distro_xml())
 
-        pkgid = pkg.get_id()
-        cptname = pki.get_name()
-        arch = pki.get_architecture()
+    pkgid = pkg.get_id()
+    cptname = pki.get_name()
+    arch = pki.get_architecture()
 
-        dest_pkgfname = "%s_%s.ipk" % (pkgid.replace("/", "-"), arch)
+    dest_pkgfname = "%s_%s.ipk" % (pkgid.replace("/", "-"), arch)
 
-        cpt_desc = cpt.get_description()
-        if not cpt_desc:
-            cpt_desc = "<p>A software component</p>"
+    cpt_desc = cpt.get_description()
+    if not cpt_desc:
+        cpt_desc = "<p>A software component</p>"
 
-        # we just accept packages for the master repository for now
-        repo_name = dsc.get_val('Target')
-        repo = None
+    repo_pool_path = os.path.join(repo_root, "pool", build_cpt_path (cptname))
+    repo_icons_path = os.path.join(repo_root, "assets", build_cpt_path (cptname), pki.get_version(), "icons")
+    pkg_dest = os.path.join(repo_pool_path, dest_pkgfname)
+    repo_location = os.path.join(build_cpt_path (cptname), dest_pkgfname)
+
+    # never replace a different package of the same name, version and architecture
+    if os.path.exists(pkg_dest) and not os.path.samefile(pkg_dest, blobs.path_for(sha256sum)):
+        raise ImportRejected("Package %s (%s) already exists in the repository." % (pkgid, arch))
+
+    # remember what we create, so it can be removed again if the
+    # import of the upload is rolled back
+    written = list()
+    if not os.path.exists(repo_icons_path):
+        written.append(repo_icons_path)
+    if not os.path.exists(pkg_dest):
+        written.append(pkg_dest)
+
+    with stats.stage('icons'):
+        pkg.extract_appstream_icons(repo_icons_path)
+        icon_sizes = find_icon_sizes(repo_root, cptname, pki.get_version())
+
+    with stats.stage('pool'):
+        blobs.link_to(sha256sum, pkg_dest)
+
+    return dict(
+        cid=cpt.get_id(),
+        cpt_kind=AppStream.ComponentKind.to_string(cpt.get_kind()),
+        xdg_categories=list(cpt.get_categories() or []),
+        sdk=True if pki.get_kind() == Limba.PackageKind.DEVEL else False,
+        cpt_name=cpt.get_name(),
+        summary=cpt.get_summary(),
+        description=cpt_desc,
+        developer_name=cpt.get_developer_name(),
+        url=cpt.get_url(AppStream.UrlKind.HOMEPAGE),
+        xml=cpt_xml,
+        xml_fragment=cpt_fragment,
+        name=pki.get_name(),
+        version=pki.get_version(),
+        fname=repo_location,
+        architecture=arch,
+        sha256sum=sha256sum,
+        dependencies=pki.get_dependencies(),
+        icon_sizes=",".join(icon_sizes),
+        written=written,
+        )
+
+
+def _run_import_job(job):
+    """
+    Verify and place all files of one DSC upload.
+
+    Runs either inline or in a worker of the import process pool, and
+    reports back a plain dict, which is turned into database rows by
+    the importer.
+    """
+
+    stats = ImportStats()
+    blobs = BlobStore(job['blobs_root'])
+    result = _import_job_files(job, blobs, stats)
+    stats.count('bytes_hashed', blobs.bytes_hashed)
+    result['stats'] = stats.as_dict()
+    return result
+
+
+def _import_job_files(job, blobs, stats):
+    dsc = job['dsc']
+    result = dict(dscfile=job['dscfile'], packages=list(), rejects=list())
+
+    # signatures are verified in batches by the importer before the job runs
+    key, error = job['signature']
+    if error:
+        result['rejects'].append("Validation failed: %s" % (error))
+        return result
+    if not key:
+        result['rejects'].append("Validation failed: No valid signing key found")
+        return result
+    key = key.replace(' ', '')
+
+    if key != job['pgpfpr']:
+        result['rejects'].append("Validation failed: Fingerprint does not match user")
+        return result
+
+    # if we are here, everything is fine - we can import the packages if their checksums match
+    try:
+        entries = dsc.get_file_entries()
+    except Exception as e:
+        result['rejects'].append("Validation failed: %s" % (str(e)))
+        return result
+
+    for sha256sum, size, fname in entries:
+        if sha256sum in job['skip']:
+            continue
+        fname_full = os.path.join(job['import_dir'], fname)
+        if not os.path.isfile(fname_full) and not blobs.has(sha256sum):
+            result['rejects'].append("Validation failed: File '%s' is missing" % (fname))
+            return result
+        # the package is verified while it is added to the blob store, and
+        # only the verified copy is opened afterwards
         try:
-            repo = Repository.query.filter_by(name=repo_name).one()
-        except:
-            self._reject_dsc("Could not find target repository: %s" % (repo_name), dsc)
-            return
+            with stats.stage('hash'):
+                blobs.add_file(fname_full, sha256sum, size)
+        except BlobValidationError as e:
+            # the file may still be uploaded, which is no reason to reject it
+            if still_written(fname_full):
+                result['retry'] = str(e)
+            else:
+                result['rejects'].append("Validation failed: %s" % (str(e)))
+            return result
+        try:
+            result['packages'].append(_place_package(blobs, sha256sum, job['repo_root'], stats))
+        except ImportRejected as e:
+            result['rejects'].append(str(e))
+        except Exception as e:
+            # broken packages must not take down the whole import run
+            result['rejects'].append("Unable to import package '%s': %s" % (fname, str(e)))
+
+    return result
+
+
+class IPKImporter():
+    def __init__(self, search_dir, stats=None):
+        self._import_dir = search_dir
+        # stage timings of the workers are summed up, so with several
+        # jobs they can exceed the wall-clock time of the run
+        self.stats = stats if stats else ImportStats()
+        self._claims = WorkClaims(search_dir, current_app.config['PKG_MORGUE_DIR'],
+                                  BlobStore(current_app.config['BLOBS_ROOT']))
+        self._rejected = set()
+        self._retry = set()
+        self._stale_pages = set()
+
+        # (repository id, sha256sum) of all packages we know are imported
+        self._known_digests = set()
+        self._known_rows = NewRowTracker(Package.id)
+
+        # all categories are loaded once, so mapping them needs no queries
+        cats = dict((c.idname, c) for c in Category.query.all())
+        self._cat_by_idname = cats
+        self._xdg_cat_map = { 'AudioVideo': cats["multimedia"],
+                        'Audio': cats["multimedia"],
+                        'Video': cats["multimedia"],
+                        'Development': cats["development"],
+                        'Education': cats["education"],
+                        'Game': cats["games"],
+                        'Graphics': cats["graphics"],
+                        'Network': cats["network"],
+                        'Office': cats["customization"],
+                        'Science': cats["science"],
+                        'Settings': cats["tools"],
+                        'System': cats["system"],
+                        'Utility': cats["tools"],
+
+                        'Arcade': cats["arcade"]
+                      }
 
-        repo_pool_path = os.path.join(repo.root_dir, "pool", build_cpt_path (cptname))
-        repo_icons_path = os.path.join(repo.root_dir, "assets", build_cpt_path (cptname), pki.get_version(), "icons")
-        pkg_dest = os.path.join(repo_pool_path, dest_pkgfname)
-        repo_location = os.path.join(build_cpt_path (cptname), dest_pkgfname)
 
+    def _map_categories(self, cpt_kind, xdg_cats):
+        if cpt_kind != AppStream.ComponentKind.to_string(AppStream.ComponentKind.DESKTOP):
+            return [self._cat_by_idname["components"]]
+        if not xdg_cats:
+            return [self._cat_by_idname["other"]]
+
+        cats = list()
+        for xcat in xdg_cats:
+            cat = self._xdg_cat_map.get(xcat)
+            if cat:
+                cats.append(cat)
+        if len(cats) == 0:
+            return [self._cat_by_idname["other"]]
+
+        return cats
+
+
+    def _add_package(self, data, repo):
         dbcpt = Component(
-            cid=cpt.get_id(),
-            kind=AppStream.ComponentKind.to_string(cpt.get_kind()),
-            sdk=True if pki.get_kind() == Limba.PackageKind.DEVEL else False,
-            name=cpt.get_name(),
-            summary=cpt.get_summary(),
-            description=cpt_desc,
-            developer_name=cpt.get_developer_name(),
-            url=cpt.get_url(AppStream.UrlKind.HOMEPAGE),
-            xml=cpt_xml,
-            repository=repo
+            cid=data['cid'],
+            kind=data['cpt_kind'],
+            sdk=data['sdk'],
+            name=data['cpt_name'],
+            summary=data['summary'],
+            description=data['description'],
+            developer_name=data['developer_name'],
+            url=data['url'],
+            xml=data['xml'],
+            xml_fragment=data['xml_fragment'],
+            repository_id=repo.id
             )
-        dbcpt.categories = self._map_categories(cpt)
+        dbcpt.categories = self._map_categories(data['cpt_kind'], data['xdg_categories'])
+        self._stale_pages.add(software_page_tag(dbcpt.cid))
+        for cat in dbcpt.categories:
+            self._stale_pages.add(category_page_tag(cat.idname))
         db.session.add(dbcpt)
 
         dbpkg = Package(
-            name=pki.get_name(),
-            version=pki.get_version(),
-            kind=PackageKind.SDK if pki.get_kind() == Limba.PackageKind.DEVEL else PackageKind.COMMON,
-            fname=repo_location,
-            architecture=arch,
-            sha256sum=sha256sum,
-            dependencies=pki.get_dependencies(),
+            name=data['name'],
+            version=data['version'],
+            kind=PackageKind.SDK if data['sdk'] else PackageKind.COMMON,
+            fname=data['fname'],
+            architecture=data['architecture'],
+            sha256sum=data['sha256sum'],
+            dependencies=data['dependencies'],
+            icon_sizes=data['icon_sizes'],
             component=dbcpt,
-            repository=repo
+            repository_id=repo.id
             )
         db.session.add(dbpkg)
 
-        pkg.extract_appstream_icons(repo_icons_path)
+        IndexState.mark_changed(repo.id, data['architecture'])
 
-        if not os.path.exists(repo_pool_path):
-            os.makedirs(repo_pool_path)
-        shutil.copyfile(pkg_fname, pkg_dest)
 
+    def _refresh_known_digests(self):
+        """
+        Fetch the checksums of packages imported since the last call,
+        possibly by other importers.
+        """
+
+        query = db.session.query(Package.id, Package.repository_id, Package.sha256sum)
+        for pkg_id, repo_id, sha256sum in self._known_rows.fetch_new(query):
+            self._known_digests.add((repo_id, sha256sum))
 
-    def _reject_dsc(self, reason, dsc):
-        print("REJECT: %s => %s" % (reason, str(dsc)))
-        # TODO: Actually reject the package and move it to the morgue
 
+    def _journal(self, dsc, state, reason=None):
+        entry = ImportJournalEntry.query.filter_by(dsc_sha256=dsc.sha256sum).first()
+        if not entry:
+            entry = ImportJournalEntry(dsc_sha256=dsc.sha256sum)
+            db.session.add(entry)
+        entry.dsc_name = os.path.basename(dsc.fname)
+        entry.state = state
+        entry.reason = reason
+        entry.worker = self._claims.worker_id
+
+
+    def _reject_dsc(self, reason, dsc):
+        print("REJECT: %s => %s" % (reason, dsc.fname))
+        self.stats.reject(reason)
+        # the upload is moved to the morgue once its transaction is committed
+        self._rejected.add(dsc.fname)
+        self._journal(dsc, ImportState.REJECTED, reason)
+
+
+    def _remove_written(self, result):
+        for data in result['packages']:
+            for path in data['written']:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                elif os.path.exists(path):
+                    os.remove(path)
+
+
+    def _add_result(self, result, repo):
+        """
+        Add the packages of one upload to the database, inside a savepoint,
+        so a failure only discards this upload. An upload is added
+        completely or not at all: if any of its files was rejected, none
+        of its packages are added.
+        Returns True if packages were added.
+        """
+
+        if result['rejects']:
+            self._remove_written(result)
+            return False
+
+        # a conflict creating these would fail the whole upload in its savepoint
+        for arch in set([data['architecture'] for data in result['packages']]):
+            IndexState.ensure(repo.id, arch)
+
+        added = list()
+        savepoint = db.session.begin_nested()
+        try:
+            for data in result['packages']:
+                # an earlier upload of this run may have added the same payload
+                if (repo.id, data['sha256sum']) in self._known_digests:
+                    continue
+                if Package.query.filter_by(repository_id=repo.id, name=data['name'], version=data['version'],
+                                           architecture=data['architecture']).first():
+                    result['rejects'].append("Package %s %s (%s) already exists in the repository." %
+                                             (data['name'], data['version'], data['architecture']))
+                    continue
+                self._add_package(data, repo)
+                added.append((repo.id, data['sha256sum']))
+            if result['rejects']:
+                savepoint.rollback()
+                self._remove_written(result)
+                return False
+            db.session.flush()
+            savepoint.commit()
+        except Exception as e:
+            savepoint.rollback()
+            self._remove_written(result)
+            result['rejects'].append("Import failed: %s" % (str(e)))
+            added = list()
+        # payloads only count as known once they are in the database
+        self._known_digests.update(added)
+        self.stats.count('packages', len(added))
+        return len(added) > 0
+
+
+    def _prepare_job(self, dscfile):
+        """
+        Resolve everything a DSC upload needs from the database, so the
+        remaining work can be done without database access.
+        """
 
-    def _process_dsc(self, dscfile):
         dsc = DSCFile()
         dsc.open(dscfile)
 
+        # uploads imported before an interrupted run are not imported again
+        imported = ImportJournalEntry.query.filter_by(dsc_sha256=dsc.sha256sum,
+                                                      state=ImportState.IMPORTED).first() is not None
+
         uploader = dsc.get_val('Uploader')
         if not uploader:
             self._reject_dsc("Uploader field was not set.", dsc)
-            return
+            return None
         m = re.findall(r'<(.*?)>', uploader)
         if not m:
             self._reject_dsc("Unable to get uploader email address.", dsc)
-            return
+            return None
 
         user = None
         try:
             user = User.query.filter_by(email=m[0]).one()
         except:
             self._reject_dsc("Could not find user '%s'" % (uploader), dsc)
-            return
+            return None
+
+        repo_name = dsc.get_val('Target')
+        repo = refdata.repository(repo_name)
+        if not repo:
+            self._reject_dsc("Could not find target repository: %s" % (repo_name), dsc)
+            return None
 
-        key = None
+        # payloads already in the repository are skipped before doing any real work
         try:
-            key = dsc.validate(user.gpghome)
-            key = key.replace(' ', '')
+            entries = dsc.get_file_entries()
         except Exception as e:
             self._reject_dsc("Validation failed: %s" % (str(e)), dsc)
+            return None
+        # the files of skipped payloads are only removed after the signature
+        # was verified, like those of every other upload
+        skip = set()
+        for sha256sum, size, fname in entries:
+            if imported or (repo.id, sha256sum) in self._known_digests:
+                skip.add(sha256sum)
+
+        job = dict(dscfile=dscfile,
+                   dsc=dsc,
+                   gpghome=user.gpghome,
+                   pgpfpr=user.pgpfpr,
+                   import_dir=os.path.dirname(dscfile),
+                   blobs_root=current_app.config['BLOBS_ROOT'],
+                   skip=skip,
+                   skip_all=bool(entries) and len(skip) == len(entries),
+                   repo_root=repo.root_dir)
+        return (job, repo)
+
+
+    def import_dsc_files(self, dscfiles, jobs=1):
+        """
+        Import the given DSC uploads.
+
+        Uploads are claimed in batches of CLAIM_BATCH_SIZE, so each one is
+        imported by exactly one importer even if several share the incoming
+        directory, and the next batch is only claimed once the current one
+        is done. Uploads which are not complete yet are left alone.
+
+        Signatures of a batch are verified together first. With jobs > 1,
+        hashing, IPK parsing and file placement then run in a pool of
+        worker processes, while this process remains the only one writing
+        to the database.
+        Every upload is added in its own savepoint and recorded in the
+        import journal, and the transaction is committed every
+        COMMIT_INTERVAL uploads.
+        Returns the set of IDs of the repositories which received new packages.
+        """
+
+        changed_repos = set()
+        stats = self.stats
+
+        with stats.stage('claim'):
+            self._claims.recover_stale()
+        blobs = BlobStore(current_app.config['BLOBS_ROOT'])
+
+        pending = list(dscfiles)
+        while pending:
+            with stats.stage('claim'):
+                claimed = list()
+                while pending and len(claimed) < CLAIM_BATCH_SIZE:
+                    fname = pending.pop(0)
+                    dsc = DSCFile()
+                    try:
+                        dsc.open(fname)
+                    except (IOError, OSError):
+                        # claimed by another worker in the meantime
+                        continue
+                    try:
+                        dsc.get_file_entries()
+                    except DscFileException as e:
+                        # rejected before claiming, as claiming moves the files it names
+                        if self._claims.reject_invalid(fname):
+                            self._reject_dsc("Validation failed: %s" % (str(e)), dsc)
+                            db.session.commit()
+                        continue
+                    if not dsc.files_complete(os.path.dirname(fname), blobs.has):
+                        continue
+                    claimed_dsc = self._claims.claim(fname)
+                    if claimed_dsc:
+                        claimed.append(claimed_dsc)
+            if claimed:
+                stats.count('uploads', len(claimed))
+                try:
+                    self._import_claimed(claimed, jobs, changed_repos)
+                except:
+                    # nobody else would recover the claims of a living worker
+                    db.session.rollback()
+                    self._claims.release_all()
+                    raise
+
+        return changed_repos
+
+
+    def _import_claimed(self, claimed, jobs, changed_repos):
+        stats = self.stats
+        self._rejected = set()
+        self._retry = set()
+        self._stale_pages = set()
+        with stats.stage('prepare'):
+            self._refresh_known_digests()
+            prepared = list()
+            for fname in claimed:
+                res = self._prepare_job(fname)
+                if res:
+                    prepared.append(res)
+        if not prepared:
+            db.session.commit()
+            self._finish_claims(claimed)
             return
 
-        if key != user.pgpfpr:
-            self._reject_dsc("Validation failed: Fingerprint does not match user", dsc)
-            return
+        self._claims.heartbeat()
+        with stats.stage('gpg'):
+            signatures = SignatureVerifier(workers=jobs).verify(
+                                [(job['dscfile'], job['gpghome']) for job, repo in prepared])
+        for job, repo in prepared:
+            job['signature'] = signatures[job['dscfile']]
+
+        # uploads rejected or skipped while preparing are finished with the first commit
+        prepared_names = set([job['dscfile'] for job, repo in prepared])
+        unfinished = [fname for fname in claimed if fname not in prepared_names]
+
+        pool = None
+        job_list = [job for job, repo in prepared]
+        if jobs > 1 and len(job_list) > 1:
+            pool = multiprocessing.Pool(min(jobs, len(job_list)))
+            results = pool.imap(_run_import_job, job_list)
+        else:
+            results = (_run_import_job(job) for job in job_list)
 
-        # if we are here, everything is fine - we can import the packages if their checksums match
-        for sha256sum, fname in dsc.get_files().items():
-            real_sha256 = None
-            fname_full = os.path.join(self._import_dir, fname)
-            with open(fname_full, 'rb') as f:
-                real_sha256 = sha256(f.read()).hexdigest()
-            if real_sha256 != sha256sum:
-                self._reject_dsc("Validation failed: Checksum mismatch for '%s'" % (fname), dsc)
-                return
-            self._import_package(fname_full, sha256sum, dsc)
-
-
-    def import_packages(self):
-        for fname in glob.glob(self._import_dir+"/*.dsc"):
-            self._process_dsc(fname)
-        db.session.commit()
+        try:
+            # imap returns results in submission order, so the database
+            # ends up the same as with a serial run
+            for i, result in enumerate(results):
+                # tell other importers we are still working on our claims
+                self._claims.heartbeat()
+                job, repo = prepared[i]
+                stats.merge(result['stats'])
+                if result.get('retry'):
+                    # returned to the incoming directory, and claimed again once complete
+                    print("RETRY: %s => %s" % (result['retry'], job['dscfile']))
+                    self._remove_written(result)
+                    self._retry.add(job['dscfile'])
+                    unfinished.append(job['dscfile'])
+                    continue
+                if job['skip_all'] and not result['rejects']:
+                    print("SKIP: Already imported => %s" % (job['dscfile']))
+                with stats.stage('db'):
+                    if self._add_result(result, repo):
+                        changed_repos.add(repo.id)
+                    for reason in result['rejects']:
+                        self._reject_dsc(reason, job['dsc'])
+                    if not result['rejects']:
+                        self._journal(job['dsc'], ImportState.IMPORTED)
+                unfinished.append(job['dscfile'])
+
+                # commit regularly, so an interrupted run can resume from here
+                if len(unfinished) >= COMMIT_INTERVAL:
+                    with stats.stage('db'):
+                        db.session.commit()
+                    self._invalidate_pages()
+                    self._finish_claims(unfinished)
+                    unfinished = list()
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+        with stats.stage('db'):
+            db.session.commit()
+        self._invalidate_pages()
+        self._finish_claims(unfinished)
+
+
+    def _invalidate_pages(self):
+        # only called after a commit, so pages can not be cached with the old data again
+        if not self._stale_pages:
+            return
+        invalidate_pages(*self._stale_pages)
+        cache_generation.bump()
+        self._stale_pages = set()
+
+
+    def _finish_claims(self, claimed):
+        for fname in claimed:
+            if fname in self._retry:
+                self._claims.release(fname)
+            elif fname in self._rejected:
+                self._claims.reject(fname)
+            else:
+                self._claims.done(fname)
+
+
+    def remove_unused_blobs(self):
+        """
+        Remove payloads from the blob store which neither a package nor
+        an upload refers to.
+        """
+
+        # the uploads are listed first: a payload is only removed from them
+        # after its package was committed
+        referenced = self._claims.referenced_payloads()
+        referenced.update([sha256sum for (sha256sum,) in db.session.query(Package.sha256sum).distinct()])
+        blobs = BlobStore(current_app.config['BLOBS_ROOT'])
+        with self.stats.stage('blobs'):
+            removed = blobs.remove_unreferenced(referenced, current_app.config.get('BLOB_GRACE', 3600))
+        self.stats.count('blobs_removed', removed)
+        return removed
+
+
+    def import_packages(self, jobs=1):
+        """
+        Import all DSC uploads from the incoming directory.
+        """
+
+        return self.import_dsc_files(sorted(glob.glob(self._import_dir+"/*.dsc")), jobs)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public  License
+# as published by the Free Software Foundation; either version
+# 3.0 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.
+
+from sqlalchemy import Column
+
+from ..extensions import db
+from ..utils import get_current_time
+
+from .constants import ImportState
+
+
+class SignatureCheck(db.Model):
+
+    __tablename__ = 'signature_checks'
+
+    id = Column(db.Integer, primary_key=True)
+    dsc_sha256 = Column(db.String(), nullable=False, index=True)
+    # identifies the state of the keyring the signature was checked against
+    keyring = Column(db.String(), nullable=False)
+
+    fingerprint = Column(db.String(), nullable=True)
+    error = Column(db.String(), nullable=True)
+
+    created_time = Column(db.DateTime, default=get_current_time)
+
+
+class ImportJournalEntry(db.Model):
+
+    __tablename__ = 'import_journal'
+
+    id = Column(db.Integer, primary_key=True)
+    dsc_sha256 = Column(db.String(), nullable=False, unique=True, index=True)
+    dsc_name = Column(db.String(), nullable=False)
+
+    state = Column(db.Integer, default=ImportState.PENDING)
+    reason = Column(db.String(), nullable=True)
+    worker = Column(db.String(), nullable=True)
+
+    created_time = Column(db.DateTime, default=get_current_time)
+    updated_time = Column(db.DateTime, default=get_current_time, onupdate=get_current_time)
+
+
+class ImportRun(db.Model):
+
+    __tablename__ = 'import_runs'
+
+    id = Column(db.Integer, primary_key=True)
+    started_time = Column(db.DateTime, default=get_current_time, index=True)
+    duration = Column(db.Float, default=0.0)
+
+    packages = Column(db.Integer, default=0)
+    rejects = Column(db.Integer, default=0)
+    bytes_hashed = Column(db.BigInteger, default=0)
+
+    # JSON summary with the per-stage timings
+    summary = Column(db.Text(), nullable=False)
+
+    @property
+    def packages_per_second(self):
+        if not self.duration:
+            return 0.0
+        return self.packages / self.duration
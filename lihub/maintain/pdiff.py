@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public  License
+# as published by the Free Software Foundation; either version
+# 3.0 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.
+
+"""
+    Delta files for the repository indices, in the spirit of Debian's pdiffs.
+
+    Next to every index file <name>.gz a directory <name>.diff is kept. It
+    contains an "Index" manifest and ed scripts, each named after the SHA-256
+    of the uncompressed index content it applies to:
+
+        SHA256-Current: <sha256> <size>
+        SHA256-History:
+         <sha256> <size> <patch>
+        SHA256-Patches:
+         <sha256> <size> <patch>
+
+    A client whose index matches an entry of the history applies that patch
+    and all following ones, in order, to arrive at the current index.
+
+    Computing a delta needs both versions in memory and takes up to
+    quadratic time, so indices larger than MAX_DIFF_INPUT_SIZE get none,
+    and clients download them in full.
+"""
+
+import os
+import gzip
+import hashlib
+import difflib
+
+from ..utils import open_gzip_writer, close_gzip_writer
+
+DIFF_INDEX_NAME = "Index"
+
+# uncompressed size up to which deltas are computed
+MAX_DIFF_INPUT_SIZE = 4 * 1024 * 1024
+# read files in chunks of this size while hashing them
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def _open_index(fname):
+    with open(fname, 'rb') as f:
+        compressed = f.read(2) == '\x1f\x8b'
+    return gzip.open(fname, 'rb') if compressed else open(fname, 'rb')
+
+
+def read_index_lines(fname):
+    """
+    Return the lines of an index file, which may or may not be compressed.
+    """
+
+    f = _open_index(fname)
+    try:
+        return f.read().splitlines(True)
+    finally:
+        f.close()
+
+
+def index_digest(fname):
+    """
+    Return the SHA-256 and the size of the uncompressed content of an
+    index file, without reading all of it into memory.
+    """
+
+    h = hashlib.sha256()
+    size = 0
+    f = _open_index(fname)
+    try:
+        while True:
+            chunk = f.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+            size += len(chunk)
+    finally:
+        f.close()
+    return h.hexdigest(), size
+
+
+def ed_script(old_lines, new_lines):
+    """
+    Return an ed script turning old_lines into new_lines, or None if the
+    change can not be expressed as one.
+    """
+
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines)
+    script = list()
+    # commands are emitted from the end of the file, so that the line
+    # numbers of earlier hunks stay valid while the script is applied
+    for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+        if tag == 'equal':
+            continue
+        if tag == 'delete':
+            script.append("%i,%id\n" % (i1 + 1, i2))
+            continue
+
+        lines = new_lines[j1:j2]
+        for line in lines:
+            # ed can neither add a lone "." nor a line without newline
+            if line == ".\n" or not line.endswith("\n"):
+                return None
+        if tag == 'insert':
+            script.append("%ia\n" % i1)
+        else:
+            script.append("%i,%ic\n" % (i1 + 1, i2))
+        script.extend(lines)
+        script.append(".\n")
+
+    return "".join(script)
+
+
+def _read_diff_index(fname):
+    history = list()
+    patches = dict()
+    if not os.path.isfile(fname):
+        return history, patches
+
+    section = None
+    with open(fname, 'r') as f:
+        for line in f:
+            if not line.startswith(" "):
+                section = line.split(":", 1)[0]
+                continue
+            parts = line.split()
+            if len(parts) != 3:
+                continue
+            if section == "SHA256-History":
+                history.append((parts[0], int(parts[1]), parts[2]))
+            elif section == "SHA256-Patches":
+                patches[parts[2]] = (parts[0], int(parts[1]))
+    return [h for h in history if h[2] in patches], patches
+
+
+def _write_diff_index(fname, current, history, patches):
+    with open(fname+".new", 'w') as f:
+        f.write("SHA256-Current: %s %i\n" % current)
+        f.write("SHA256-History:\n")
+        for entry in history:
+            f.write(" %s %i %s\n" % entry)
+        f.write("SHA256-Patches:\n")
+        for sha256sum, size, name in history:
+            f.write(" %s %i %s\n" % (patches[name][0], patches[name][1], name))
+    os.rename(fname+".new", fname)
+
+
+def update_diffs(old_fname, new_fname, history_size):
+    """
+    Record the changes between the published index old_fname and its
+    replacement new_fname in the delta directory of the index. At most
+    history_size patches are kept.
+    """
+
+    base_name = os.path.basename(old_fname)
+    if base_name.endswith(".gz"):
+        base_name = base_name[:-3]
+    diff_dir = os.path.join(os.path.dirname(old_fname), base_name + ".diff")
+    index_fname = os.path.join(diff_dir, DIFF_INDEX_NAME)
+    if not os.path.exists(diff_dir):
+        os.makedirs(diff_dir)
+
+    current = index_digest(new_fname)
+
+    history, patches = _read_diff_index(index_fname)
+    if os.path.isfile(old_fname):
+        old_sha256, old_size = index_digest(old_fname)
+
+        if old_sha256 != current[0]:
+            script = None
+            if old_size <= MAX_DIFF_INPUT_SIZE and current[1] <= MAX_DIFF_INPUT_SIZE:
+                script = ed_script(read_index_lines(old_fname), read_index_lines(new_fname))
+            if script is None:
+                # clients can not bridge this change, so the history ends here
+                history = list()
+            else:
+                # the content may have been seen before, its newest patch wins
+                history = [h for h in history if h[0] != old_sha256]
+                history.append((old_sha256, old_size, old_sha256))
+                patches[old_sha256] = (hashlib.sha256(script).hexdigest(), len(script))
+
+                gz = open_gzip_writer(os.path.join(diff_dir, old_sha256 + ".gz.new"))
+                try:
+                    gz.write(script)
+                finally:
+                    close_gzip_writer(gz)
+                os.rename(os.path.join(diff_dir, old_sha256 + ".gz.new"),
+                          os.path.join(diff_dir, old_sha256 + ".gz"))
+
+    if history_size > 0:
+        history = history[-history_size:]
+    else:
+        history = list()
+    _write_diff_index(index_fname, current, history, patches)
+
+    # drop patches which fell out of the history
+    keep = set([name + ".gz" for sha256sum, size, name in history])
+    keep.add(DIFF_INDEX_NAME)
+    for fname in os.listdir(diff_dir):
+        if fname not in keep:
+            os.remove(os.path.join(diff_dir, fname))
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public  License
+# as published by the Free Software Foundation; either version
+# 3.0 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.
+
+"""
+    Compressed variants of the index files and the Release manifest.
+
+    The Release file of a repository lists size and SHA-256 of every index
+    file. Each file is also available as by-hash/SHA256/<sha256> in its
+    directory, so those paths never change their content and can be cached
+    forever, while only Release needs to be revalidated.
+"""
+
+import os
+import gzip
+import zlib
+from hashlib import sha256
+from email.utils import formatdate
+from multiprocessing.pool import ThreadPool
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+RELEASE_NAME = "Release"
+BY_HASH_DIR = os.path.join("by-hash", "SHA256")
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def _gzip_compressor():
+    # a gzip stream without file name and timestamp, so it is reproducible
+    return zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def _xz_compressor():
+    return lzma.LZMACompressor()
+
+
+def _zstd_compressor():
+    return zstandard.ZstdCompressor(level=19).compressobj()
+
+
+def compressors():
+    """
+    Return (extension, compressor factory) pairs of all formats the index
+    files are published in. xz and zstd are optional.
+    """
+
+    formats = [(".gz", _gzip_compressor)]
+    if lzma:
+        formats.append((".xz", _xz_compressor))
+    if zstandard:
+        formats.append((".zst", _zstd_compressor))
+    return formats
+
+
+def write_plain_copy(src, dest):
+    """
+    Copy an index file to dest, decompressing it if it is gzip compressed.
+    """
+
+    with open(src, 'rb') as f:
+        compressed = f.read(2) == '\x1f\x8b'
+    fin = gzip.open(src, 'rb') if compressed else open(src, 'rb')
+    try:
+        with open(dest, 'wb') as fout:
+            while True:
+                data = fin.read(READ_CHUNK_SIZE)
+                if not data:
+                    break
+                fout.write(data)
+    finally:
+        fin.close()
+
+
+def _compress_file(args):
+    src, dest, factory = args
+    comp = factory()
+    with open(src, 'rb') as fin:
+        with open(dest, 'wb') as fout:
+            while True:
+                data = fin.read(READ_CHUNK_SIZE)
+                if not data:
+                    break
+                fout.write(comp.compress(data))
+            fout.write(comp.flush())
+    return dest
+
+
+def gzip_file(src, dest):
+    """
+    Write a reproducible gzip compressed copy of src to dest.
+    """
+
+    _compress_file((src, dest, _gzip_compressor))
+
+
+def compress_variants(src, dest_base):
+    """
+    Write all compressed variants of the plain file src as dest_base plus
+    the format's extension plus ".new", one thread per format.
+    Returns the names of the files that were written.
+    """
+
+    tasks = [(src, dest_base + ext + ".new", factory) for ext, factory in compressors()]
+    pool = ThreadPool(len(tasks))
+    try:
+        return pool.map(_compress_file, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def file_digest(fname):
+    h = sha256()
+    size = 0
+    with open(fname, 'rb') as f:
+        while True:
+            data = f.read(READ_CHUNK_SIZE)
+            if not data:
+                break
+            h.update(data)
+            size += len(data)
+    return h.hexdigest(), size
+
+
+def read_release_hashes(fname):
+    """
+    Return the set of SHA-256 sums listed in a Release file.
+    """
+
+    hashes = set()
+    if not os.path.isfile(fname):
+        return hashes
+    with open(fname, 'r') as f:
+        for line in f:
+            if line.startswith(" "):
+                hashes.add(line.split()[0])
+    return hashes
+
+
+def _release_entries(indices_dir):
+    for arch in sorted(os.listdir(indices_dir)):
+        arch_dir = os.path.join(indices_dir, arch)
+        if not os.path.isdir(arch_dir):
+            continue
+        for name in sorted(os.listdir(arch_dir)):
+            path = os.path.join(arch_dir, name)
+            if name.endswith(".new"):
+                continue
+            if os.path.isfile(path):
+                yield arch_dir, os.path.join(arch, name)
+            elif name.endswith(".diff") and os.path.isfile(os.path.join(path, "Index")):
+                yield None, os.path.join(arch, name, "Index")
+
+
+def _link_by_hash(arch_dir, fname, sha256sum):
+    by_hash = os.path.join(arch_dir, BY_HASH_DIR)
+    if not os.path.exists(by_hash):
+        os.makedirs(by_hash)
+    dest = os.path.join(by_hash, sha256sum)
+    if not os.path.exists(dest):
+        os.link(fname, dest)
+
+
+def _prune_by_hash(indices_dir, keep):
+    for arch in os.listdir(indices_dir):
+        by_hash = os.path.join(indices_dir, arch, BY_HASH_DIR)
+        if not os.path.isdir(by_hash):
+            continue
+        for name in os.listdir(by_hash):
+            if name not in keep:
+                os.remove(os.path.join(by_hash, name))
+
+
+def write_release(indices_dir, origin):
+    """
+    Write the Release manifest of a repository's indices directory and
+    add the by-hash paths of all index files.
+    Files only referenced by the previous Release stay available, so clients
+    which fetched it just before can still download them.
+    """
+
+    release_fname = os.path.join(indices_dir, RELEASE_NAME)
+    previous = read_release_hashes(release_fname)
+
+    entries = list()
+    for arch_dir, relname in _release_entries(indices_dir):
+        fname = os.path.join(indices_dir, relname)
+        sha256sum, size = file_digest(fname)
+        if arch_dir:
+            _link_by_hash(arch_dir, fname, sha256sum)
+        entries.append((sha256sum, size, relname))
+
+    with open(release_fname+".new", 'w') as f:
+        f.write("Origin: %s\n" % (origin))
+        f.write("Date: %s\n" % (formatdate(usegmt=True)))
+        f.write("Acquire-By-Hash: yes\n")
+        f.write("SHA256:\n")
+        for entry in entries:
+            f.write(" %s %i %s\n" % entry)
+    os.rename(release_fname+".new", release_fname)
+
+    _prune_by_hash(indices_dir, previous | set([e[0] for e in entries]))
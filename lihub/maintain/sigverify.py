@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public  License
+# as published by the Free Software Foundation; either version
+# 3.0 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.
+
+import os
+from hashlib import sha256
+from multiprocessing.pool import ThreadPool
+
+from ..extensions import db
+from ..utils import run_command
+from .dscfile import DscFileException, parse_gpg_verify_status
+from .models import SignatureCheck
+
+# maximum number of files checked by a single gpg process
+VERIFY_BATCH_SIZE = 32
+
+
+def _keyring_state(keyring):
+    """
+    Return a string identifying the current state of a keyring, so cached
+    results are not used anymore once a new key is imported.
+    """
+
+    try:
+        st = os.stat(keyring)
+    except OSError:
+        return "%s:missing" % (keyring)
+    return "%s:%d:%d" % (keyring, st.st_size, int(st.st_mtime))
+
+
+# status lines reporting the result of checking one signature
+_SIG_RESULTS = ('[GNUPG:] GOODSIG', '[GNUPG:] BADSIG', '[GNUPG:] ERRSIG')
+
+
+def _split_status_blocks(gpg_output):
+    """
+    Split the status output of "gpg --verify-files" into one block per
+    signature, using the NEWSIG line gpg emits before each one.
+
+    gpg does not say which file a block belongs to, so the blocks are only
+    returned if each of them holds exactly one signature result and no file
+    went without one. An unsigned file only produces NODATA, which would
+    shift the results of all following files.
+    """
+
+    blocks = list()
+    current = None
+    for line in gpg_output.split("\n"):
+        if line.startswith('[GNUPG:] NODATA') or line.startswith('[GNUPG:] FAILURE') \
+                or line.startswith('[GNUPG:] ERROR '):
+            return None
+        if line.startswith('[GNUPG:] NEWSIG'):
+            current = list()
+            blocks.append(current)
+        if current is not None:
+            current.append(line)
+        elif line.startswith('[GNUPG:] '):
+            # status output not belonging to any signature, we can not
+            # reliably assign results to files
+            return None
+
+    for block in blocks:
+        if len([l for l in block if l.startswith(_SIG_RESULTS)]) != 1:
+            return None
+    return ["\n".join(b) for b in blocks]
+
+
+def _verify_single(keyring, fname):
+    (gpg_output, gpg_output_stderr, exit_status) = run_command([
+        "gpg", "--batch", "--status-fd", "1",
+        "--no-default-keyring", "--keyring", keyring,
+        "--verify", fname,
+    ])
+    if exit_status == -1:
+        raise DscFileException("Unknown problem while verifying signature")
+    return parse_gpg_verify_status(gpg_output)
+
+
+def _result_for(func, *args):
+    try:
+        return (func(*args), None)
+    except DscFileException as e:
+        return (None, str(e))
+
+
+def _verify_batch(batch):
+    """
+    Verify a batch of files signed by keys from the same keyring with a
+    single gpg process. Falls back to one process per file if the output
+    can not be mapped to the files unambiguously.
+    """
+
+    keyring, fnames = batch
+    results = dict()
+    if len(fnames) > 1:
+        (gpg_output, gpg_output_stderr, exit_status) = run_command([
+            "gpg", "--batch", "--status-fd", "1",
+            "--no-default-keyring", "--keyring", keyring,
+            "--verify-files",
+        ] + fnames)
+        blocks = None
+        if exit_status != -1:
+            blocks = _split_status_blocks(gpg_output)
+        if blocks and len(blocks) == len(fnames):
+            for fname, block in zip(fnames, blocks):
+                results[fname] = _result_for(parse_gpg_verify_status, block)
+            return results
+
+    for fname in fnames:
+        results[fname] = _result_for(_verify_single, keyring, fname)
+    return results
+
+
+class SignatureVerifier():
+    """
+    Verifies the signatures of many DSC files at once.
+
+    Files are grouped by keyring and checked in batches by a pool of
+    verifier threads, each batch in one gpg process.
+    Results are cached by the checksum of the DSC file and the state
+    of the keyring, so files are never verified twice.
+    """
+
+    def __init__(self, workers=4):
+        self._workers = workers
+
+
+    def verify(self, items):
+        """
+        Verify the given (dsc_fname, gpghome) pairs.
+
+        Returns a dictionary mapping each file name to a tuple of the
+        signing key fingerprint and an error message, one of which is None.
+        """
+
+        results = dict()
+        pending = dict()
+        checksums = dict()
+        for fname, gpghome in items:
+            keyring = os.path.join(gpghome, "keyring.gpg")
+            with open(fname, 'rb') as f:
+                checksums[fname] = (sha256(f.read()).hexdigest(), _keyring_state(keyring))
+
+            cached = SignatureCheck.query.filter_by(dsc_sha256=checksums[fname][0],
+                                                    keyring=checksums[fname][1]).first()
+            if cached:
+                results[fname] = (cached.fingerprint, cached.error)
+            else:
+                pending.setdefault(keyring, list()).append(fname)
+
+        batches = list()
+        for keyring, fnames in pending.items():
+            for i in range(0, len(fnames), VERIFY_BATCH_SIZE):
+                batches.append((keyring, fnames[i:i + VERIFY_BATCH_SIZE]))
+        if not batches:
+            return results
+
+        pool = ThreadPool(min(self._workers, len(batches)))
+        try:
+            for batch_results in pool.imap_unordered(_verify_batch, batches):
+                for fname, (key, error) in batch_results.items():
+                    results[fname] = (key, error)
+                    # transient problems (e.g. gpg not being available) are not cached
+                    if error and error.startswith("Unknown problem"):
+                        continue
+                    dsc_sha256, keyring_state = checksums[fname]
+                    db.session.add(SignatureCheck(dsc_sha256=dsc_sha256,
+                                                  keyring=keyring_state,
+                                                  fingerprint=key,
+                                                  error=error))
+        finally:
+            pool.close()
+            pool.join()
+
+        return results
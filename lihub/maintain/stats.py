@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public  License
+# as published by the Free Software Foundation; either version
+# 3.0 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.
+
+import re
+import time
+import json
+from contextlib import contextmanager
+
+from ..extensions import db
+from ..utils import get_current_time
+from .models import ImportRun
+
+
+def reject_category(reason):
+    """
+    Strip file and package names from a reject reason, so rejects
+    can be grouped by their cause.
+    """
+    return re.sub(r"'[^']*'", "'*'", reason.split(" => ")[0])
+
+
+class ImportStats():
+    """
+    Per-stage timers and counters of an import run.
+
+    Instances are plain data, so workers can fill their own and the
+    importer merges them into the run's statistics.
+    """
+
+    def __init__(self):
+        self.started_time = get_current_time()
+        self._start = time.time()
+        self.stages = dict()
+        self.counters = dict()
+        self.rejects = dict()
+
+
+    @contextmanager
+    def stage(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.time() - start
+
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+
+    def reject(self, reason):
+        category = reject_category(reason)
+        self.rejects[category] = self.rejects.get(category, 0) + 1
+
+
+    def as_dict(self):
+        return dict(stages=self.stages, counters=self.counters, rejects=self.rejects)
+
+
+    def merge(self, data):
+        for name, secs in data['stages'].items():
+            self.stages[name] = self.stages.get(name, 0.0) + secs
+        for name, n in data['counters'].items():
+            self.count(name, n)
+        for category, n in data['rejects'].items():
+            self.rejects[category] = self.rejects.get(category, 0) + n
+
+
+    def summary(self):
+        duration = time.time() - self._start
+        packages = self.counters.get('packages', 0)
+        return dict(
+            started=self.started_time.isoformat(),
+            duration=round(duration, 3),
+            stages=dict((name, round(secs, 3)) for name, secs in self.stages.items()),
+            counters=self.counters,
+            packages_per_second=round(packages / duration, 3) if duration > 0 else 0.0,
+            rejects=self.rejects,
+        )
+
+
+    def save(self):
+        """
+        Store the summary of this run in the import history and return it.
+        """
+
+        summary = self.summary()
+        run = ImportRun(started_time=self.started_time,
+                        duration=summary['duration'],
+                        packages=self.counters.get('packages', 0),
+                        rejects=sum(self.rejects.values()),
+                        bytes_hashed=self.counters.get('bytes_hashed', 0),
+                        summary=json.dumps(summary, sort_keys=True))
+        db.session.add(run)
+        db.session.commit()
+        return summary
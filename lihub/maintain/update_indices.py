@@ -16,67 +16,288 @@
 # License along with this program.
 
 from ..repository.models import *
+from flask import current_app
 from ..extensions import db
-from ..utils import get_current_time, build_cpt_path
+from ..utils import get_current_time, build_cpt_path, index_shard, xml_fragment
+from .indexquery import iter_index_rows, iter_index_categories
+from .catalogdb import CATALOG_NAME, CatalogWriter
+from .pdiff import update_diffs
+from .release import write_plain_copy, gzip_file, compress_variants, file_digest, write_release
+from .generations import INDICES_LINK, begin_generation, publish_generation, prune_generations, \
+    lock_generations
 from gi.repository import Limba
 from gi.repository import AppStream
 import os
 import glob
 import shutil
-import gzip
+import multiprocessing
+
+# file listing the index shards of an architecture
+SHARD_MAP_NAME = "ShardMap"
+SHARDS_DIR = "shards"
+
+# header and footer of the AppStream distro XML we write
+METADATA_HEADER = '<?xml version="1.0" encoding="utf-8"?>\n<components version="0.8">\n'
+METADATA_FOOTER = '</components>\n'
+
 
 def safe_move_file(old_fname, new_fname):
     if not os.path.isfile(old_fname):
         return
-    if os.path.isfile(new_fname):
-        os.remove(new_fname)
+    # rename replaces an existing file atomically
     os.rename(old_fname, new_fname)
 
+
+# updater of an index worker process, created by the pool initializer
+_worker_updater = None
+
+
+def _init_index_worker():
+    global _worker_updater
+    _worker_updater = IndicesUpdater()
+
+
+def _build_index_task(task):
+    """
+    Build the index files of one (repository, architecture) pair in a worker
+    process. The worker opens its own database connections and only reads.
+    """
+
+    state_id, repo_id, arch, generation, indices_dir = task
+    try:
+        repo = Repository.query.get(repo_id)
+        _worker_updater.rebuild_index(repo, arch, indices_dir)
+    finally:
+        db.session.remove()
+    return task
+
+
 class IndicesUpdater():
-    def __init__(self):
-        pass
+    def __init__(self, jobs=1):
+        self._asdata = AppStream.Metadata()
+        self._jobs = max(1, jobs)
+
+    def _component_fragment(self, row):
+        if row.xml_fragment:
+            return row.xml_fragment
+
+        # components imported before fragments were stored have to be converted
+        self._asdata.clear_components()
+        self._asdata.parse_data(row.xml)
+        fragment = xml_fragment(self._asdata.components_to_distro_xml())
+        # GObject returns UTF-8 encoded byte strings, the database unicode
+        if isinstance(fragment, str):
+            fragment = fragment.decode('utf-8')
+        return fragment
+
+    def rebuild_index(self, repo, arch, indices_dir=None):
+        """
+        Build Metadata.xml and Index for one architecture of a repository,
+        in every compression format we publish. The files are written to
+        indices_dir, or to the published indices if it is not set.
+
+        Component data is streamed into the metadata file in a stable
+        order, so memory usage does not grow with the number of packages.
+        """
+
+        if not indices_dir:
+            indices_dir = os.path.join(repo.root_dir, INDICES_LINK)
+        repo_index_path = os.path.join(indices_dir, arch)
+        if not os.path.exists(repo_index_path):
+            os.makedirs(repo_index_path)
+
+        asdata_base = os.path.join(repo_index_path, "Metadata.xml")
+        ipkidx_base = os.path.join(repo_index_path, "Index")
+
+        ipkidx = Limba.PkgIndex()
+        shards = dict() if current_app.config.get('INDEX_SHARDING', False) else None
+        catalog = CatalogWriter(os.path.join(repo_index_path, CATALOG_NAME))
+        try:
+            with open(asdata_base+".new", 'wb') as asdata_f:
+                asdata_f.write(METADATA_HEADER)
+
+                for row in iter_index_rows(repo.id, arch):
+                    pki = Limba.PkgInfo()
+                    pki.set_name(row.name)
+                    pki.set_appname(row.cpt_name)
+                    pki.set_version(row.version)
+                    pki.set_checksum_sha256(row.sha256sum)
+                    pki.set_repo_location(row.fname)
+                    if row.dependencies:
+                        pki.set_dependencies(row.dependencies)
+                    ipkidx.add_package(pki)
+                    catalog.add_package(row)
+                    if shards is not None:
+                        shard = index_shard(row.cid)
+                        if shard not in shards:
+                            shards[shard] = Limba.PkgIndex()
+                        shards[shard].add_package(pki)
+
+                    asdata_f.write(self._component_fragment(row).encode('utf-8'))
+                    asdata_f.write("\n")
+
+                asdata_f.write(METADATA_FOOTER)
+            catalog.add_categories(iter_index_categories(repo.id, arch))
+        except Exception:
+            catalog.abort()
+            raise
+        catalog.close()
+
+        self._save_pkg_index(ipkidx, ipkidx_base+".new")
+        self._write_shards(repo_index_path, shards)
+
+        diff_history = current_app.config.get('INDEX_DIFF_HISTORY', 0)
+        variants = list()
+        for base in (asdata_base, ipkidx_base):
+            variants.extend(compress_variants(base+".new", base))
+            # the component metadata grows large quickly, only the
+            # package index gets deltas
+            if diff_history > 0 and base == ipkidx_base:
+                update_diffs(base+".gz", base+".new", diff_history)
+            elif os.path.isdir(base+".diff"):
+                shutil.rmtree(base+".diff")
+            os.remove(base+".new")
+
+            # formats whose compressor is not available anymore would go stale
+            for ext in (".gz", ".xz", ".zst"):
+                if base+ext+".new" not in variants and os.path.isfile(base+ext):
+                    os.remove(base+ext)
+
+        for fname in variants:
+            safe_move_file(fname, fname[:-4])
+
+    def _save_pkg_index(self, ipkidx, fname):
+        # we compress the index ourselves, whatever Limba writes
+        ipkidx.save_to_file(fname+".limba")
+        write_plain_copy(fname+".limba", fname)
+        os.remove(fname+".limba")
+
+    def _write_shards(self, repo_index_path, shards):
+        """
+        Write one gzip compressed index per shard and the shard map listing
+        them, or remove both if sharding is disabled.
+        """
+
+        shards_dir = os.path.join(repo_index_path, SHARDS_DIR)
+        map_fname = os.path.join(repo_index_path, SHARD_MAP_NAME)
+        # the shard set changes with the catalog, so shards are always written anew
+        if os.path.isdir(shards_dir):
+            shutil.rmtree(shards_dir)
+        if shards is None:
+            if os.path.isfile(map_fname):
+                os.remove(map_fname)
+            return
+
+        entries = list()
+        for shard in sorted(shards.keys()):
+            shard_dir = os.path.join(shards_dir, shard)
+            os.makedirs(shard_dir)
+            plain_fname = os.path.join(shard_dir, "Index")
+            self._save_pkg_index(shards[shard], plain_fname)
+            gzip_file(plain_fname, plain_fname+".gz")
+            os.remove(plain_fname)
+
+            sha256sum, size = file_digest(plain_fname+".gz")
+            entries.append((shard, sha256sum, size, os.path.join(SHARDS_DIR, shard, "Index.gz")))
+
+        with open(map_fname+".new", 'w') as f:
+            for entry in entries:
+                f.write("%s %s %i %s\n" % entry)
+        os.rename(map_fname+".new", map_fname)
+
+    def _finish_task(self, task):
+        state_id, repo_id, arch, generation, indices_dir = task
+        state = IndexState.query.get(state_id)
+        # changes made while we build stay pending for the next run
+        state.built_generation = generation
+        state.built_time = get_current_time()
+        db.session.commit()
+
+    def _build_states(self, states, force=False):
+        """
+        Build the indices of the given states, spreading the (repository,
+        architecture) pairs over worker processes if more than one job
+        was requested. Unless force is set, states another builder built
+        meanwhile are left out.
+        """
+
+        # only one builder per repository, taken in a fixed order
+        locks = list()
+        try:
+            for repo_id in sorted(set([state.repository_id for state in states])):
+                locks.append(lock_generations(Repository.query.get(repo_id).root_dir))
+            # read the states again, now that nobody else builds them
+            db.session.expire_all()
+            self._build_locked_states([s for s in states if force or s.is_stale])
+        finally:
+            for lock_f in locks:
+                lock_f.close()
+
+    def _build_locked_states(self, states):
+        # every repository gets a new generation, shared by its architectures
+        gen_dirs = dict()
+        tasks = list()
+        for state in states:
+            if state.repository_id not in gen_dirs:
+                gen_dirs[state.repository_id] = begin_generation(state.repository.root_dir)
+            tasks.append((state.id, state.repository_id, state.architecture,
+                          state.generation, gen_dirs[state.repository_id]))
+        if not tasks:
+            return
+
+        if self._jobs == 1 or len(tasks) == 1:
+            for task in tasks:
+                self.rebuild_index(Repository.query.get(task[1]), task[2], task[4])
+        else:
+            # forked workers must not share our database connections
+            db.session.remove()
+            db.engine.dispose()
+
+            pool = multiprocessing.Pool(min(self._jobs, len(tasks)), _init_index_worker)
+            try:
+                pool.map(_build_index_task, tasks)
+            finally:
+                pool.close()
+                pool.join()
+
+        # nothing is published unless all architectures of a repository were built
+        grace = current_app.config.get('INDEX_GENERATION_GRACE', 3600)
+        for repo_id in sorted(gen_dirs.keys()):
+            repo = Repository.query.get(repo_id)
+            write_release(gen_dirs[repo_id], repo.name)
+            publish_generation(repo.root_dir, gen_dirs[repo_id])
+            for task in tasks:
+                if task[1] == repo_id:
+                    self._finish_task(task)
+            prune_generations(repo.root_dir, grace)
+
+    def _states_for_repo(self, repo):
+        """
+        Return index states for all architectures of a repository,
+        creating the missing ones.
+        """
+
+        states = dict((s.architecture, s) for s in repo.index_states)
+        arches = db.session.query(Package.architecture).filter_by(repository_id=repo.id).distinct()
+        for (arch,) in arches:
+            if arch not in states:
+                states[arch] = IndexState.mark_changed(repo.id, arch)
+        db.session.commit()
+        return states.values()
 
     def rebuild_index_for_repo(self, repo):
+        self._build_states(self._states_for_repo(repo), force=True)
+
+    def rebuild_indices(self, force=False):
+        """
+        Rebuild the indices of all repositories and architectures which
+        changed since they were last built, or all of them if force is set.
+        """
 
-        idx = dict()
-
-        for pkg in repo.packages:
-            xml = pkg.component.xml
-            if not xml:
-                continue
-
-            pki = Limba.PkgInfo()
-            pki.set_name(pkg.name)
-            pki.set_appname(pkg.component.name)
-            pki.set_version(pkg.version)
-            pki.set_checksum_sha256(pkg.sha256sum)
-            pki.set_repo_location(pkg.fname)
-            if pkg.dependencies:
-                pki.set_dependencies(pkg.dependencies)
-
-            if not idx.get(pkg.architecture):
-                idx[pkg.architecture] = dict()
-            if not idx[pkg.architecture].get('asdata'):
-                idx[pkg.architecture]['asdata'] = AppStream.Metadata()
-            if not idx[pkg.architecture].get('ipk'):
-                idx[pkg.architecture]['ipk'] = Limba.PkgIndex()
-            idx[pkg.architecture]['asdata'].parse_data(xml)
-            idx[pkg.architecture]['ipk'].add_package(pki)
-
-        for arch, idx in idx.items():
-            repo_index_path = os.path.join(repo.root_dir, "indices", arch)
-            if not os.path.exists(repo_index_path):
-                os.makedirs(repo_index_path)
-
-            asdata_fname = os.path.join(repo_index_path, "Metadata.xml.gz")
-            ipkidx_fname = os.path.join(repo_index_path, "Index.gz")
-
-            idx['asdata'].save_distro_xml(asdata_fname+".new")
-            idx['ipk'].save_to_file(ipkidx_fname+".new")
-            safe_move_file(asdata_fname+".new", asdata_fname)
-            safe_move_file(ipkidx_fname+".new", ipkidx_fname)
-
-    def rebuild_indices(self):
-        repos = Repository.query.all()
-        for repo in repos:
-            self.rebuild_index_for_repo(repo)
+        if force:
+            states = list()
+            for repo in Repository.query.all():
+                states.extend(self._states_for_repo(repo))
+        else:
+            states = IndexState.query.filter(IndexState.generation != IndexState.built_generation).all()
+        self._build_states(states, force)
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public  License
+# as published by the Free Software Foundation; either version
+# 3.0 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.
+
+import os
+import json
+import glob
+import time
+import traceback
+
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+from flask import current_app
+
+from ..extensions import db
+from ..refdata import refdata
+from ..cachegen import cache_generation
+from .dscfile import DSCFile, DscFileException
+from .blobstore import BlobStore
+from .stats import ImportStats
+
+# interval of the main loop, and of directory scans if inotify is not available
+POLL_INTERVAL = 2
+# seconds until uploads whose import failed are tried again
+RETRY_INTERVAL = 300
+
+
+class IncomingWatcher():
+    """
+    Watches the incoming directory and imports each upload as soon as
+    its DSC file and all files it references are complete.
+
+    Index regeneration is debounced: the outdated indices are rebuilt once
+    no new upload was imported for `debounce` seconds, but at the latest
+    `max_delay` seconds after the first upload they are missing.
+    Uses inotify via pyinotify if it is available, and polls otherwise.
+    """
+
+    def __init__(self, importer, updater, incoming_dir, jobs=1, debounce=30, max_delay=300):
+        self._importer = importer
+        self._updater = updater
+        self._incoming_dir = incoming_dir
+        self._jobs = jobs
+        self._debounce = debounce
+        self._max_delay = max_delay
+        self._blobs = BlobStore(current_app.config['BLOBS_ROOT'])
+
+        self._pending = set()
+        self._processed = dict()
+        self._failed = dict()
+        self._dirty_repos = set()
+        self._first_import = 0
+        self._last_import = 0
+
+
+    def _dsc_is_complete(self, dscfile):
+        dsc = DSCFile()
+        try:
+            dsc.open(dscfile)
+        except Exception:
+            # the DSC might still be in the process of being written
+            return False
+        try:
+            dsc.get_file_entries()
+        except DscFileException:
+            # handed to the importer, which rejects it
+            return True
+        # payloads already in the blob store need not be uploaded again
+        return dsc.files_complete(self._incoming_dir, self._blobs.has)
+
+
+    def _queue(self, fname):
+        # pending DSCs are rechecked in every iteration, so completing one
+        # of their referenced files needs no special handling
+        if fname.endswith(".dsc") and fname not in self._failed:
+            self._pending.add(fname)
+
+
+    def _scan(self):
+        for fname in glob.glob(self._incoming_dir+"/*.dsc"):
+            try:
+                mtime = os.path.getmtime(fname)
+            except OSError:
+                continue
+            if self._processed.get(fname) != mtime:
+                self._pending.add(fname)
+
+
+    def _process_pending(self):
+        now = time.time()
+        for fname, retry_time in self._failed.items():
+            if now >= retry_time:
+                del self._failed[fname]
+                self._pending.add(fname)
+
+        ready = list()
+        for fname in sorted(self._pending):
+            if not os.path.isfile(fname):
+                self._pending.discard(fname)
+                continue
+            if self._dsc_is_complete(fname):
+                ready.append(fname)
+        if not ready:
+            return
+
+        for fname in ready:
+            self._pending.discard(fname)
+            self._processed[fname] = os.path.getmtime(fname)
+
+        try:
+            changed = self._importer.import_dsc_files(ready, self._jobs)
+        except Exception:
+            # the importer returned its claims to the incoming directory
+            for fname in ready:
+                self._failed[fname] = time.time() + RETRY_INTERVAL
+            raise
+        # uploads returned to the incoming directory are checked again
+        for fname in ready:
+            if os.path.isfile(fname):
+                self._pending.add(fname)
+        # every batch of uploads is recorded as a run of its own
+        print(json.dumps(self._importer.stats.save(), sort_keys=True))
+        self._importer.stats = ImportStats()
+        if changed:
+            if not self._dirty_repos:
+                self._first_import = time.time()
+            self._dirty_repos.update(changed)
+            self._last_import = time.time()
+
+
+    def _update_indices(self):
+        if not self._dirty_repos:
+            return
+        now = time.time()
+        if now - self._last_import < self._debounce and now - self._first_import < self._max_delay:
+            return
+
+        # only the changed architectures of the changed repositories are rebuilt
+        self._dirty_repos = set()
+        self._updater.rebuild_indices()
+        self._importer.remove_unused_blobs()
+
+
+    def _iterate(self):
+        try:
+            # repositories and settings might have been changed meanwhile
+            if cache_generation.changed():
+                refdata.invalidate()
+            self._process_pending()
+            self._update_indices()
+        except Exception:
+            # keep the daemon alive, the failed uploads are tried again
+            # after RETRY_INTERVAL seconds
+            traceback.print_exc()
+            db.session.rollback()
+
+
+    def run(self):
+        self._scan()
+
+        if not pyinotify:
+            print("pyinotify is not available, scanning the incoming directory every %i seconds." % (POLL_INTERVAL))
+            while True:
+                self._iterate()
+                time.sleep(POLL_INTERVAL)
+                self._scan()
+
+        watcher = self
+
+        class EventHandler(pyinotify.ProcessEvent):
+            def process_IN_CLOSE_WRITE(self, event):
+                watcher._queue(event.pathname)
+
+            def process_IN_MOVED_TO(self, event):
+                watcher._queue(event.pathname)
+
+        wm = pyinotify.WatchManager()
+        notifier = pyinotify.Notifier(wm, EventHandler(), timeout=POLL_INTERVAL * 1000)
+        wm.add_watch(self._incoming_dir, pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO)
+        try:
+            while True:
+                self._iterate()
+                if notifier.check_events():
+                    notifier.read_events()
+                    notifier.process_events()
+        finally:
+            notifier.stop()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public  License
+# as published by the Free Software Foundation; either version
+# 3.0 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.
+
+# IDs are assigned when a row is inserted, but transactions commit in any
+# order, so rows with IDs this far below the highest one seen are looked
+# for again
+ID_RESCAN_WINDOW = 10000
+# number of IDs fetched per query when loading new rows
+FETCH_CHUNK_SIZE = 500
+
+
+class NewRowTracker(object):
+    """
+    Finds the rows of a table added since the last call, for in-memory
+    structures which are updated incrementally.
+
+    A plain "id > highest seen id" would miss rows of transactions which
+    committed after one with higher IDs, like those of concurrent importers.
+    Instead, the IDs below the highest one are rescanned within a window
+    and compared to the IDs already seen.
+    """
+
+    def __init__(self, id_column):
+        self._column = id_column
+        self._seen = set()
+        self._max_id = None
+
+    def _mark(self, row_id):
+        self._seen.add(row_id)
+        if self._max_id is None or row_id > self._max_id:
+            self._max_id = row_id
+
+    def fetch_new(self, query):
+        """
+        Return the rows of query which were not returned before. The first
+        column of the query has to be the tracked ID column.
+        """
+
+        if self._max_id is None:
+            rows = query.all()
+            for row in rows:
+                self._mark(row[0])
+            return rows
+
+        low = self._max_id - ID_RESCAN_WINDOW
+        ids = [row_id for (row_id,) in query.with_entities(self._column).filter(self._column > low)]
+        new_ids = [row_id for row_id in ids if row_id not in self._seen]
+
+        rows = list()
+        for i in range(0, len(new_ids), FETCH_CHUNK_SIZE):
+            rows.extend(query.filter(self._column.in_(new_ids[i:i + FETCH_CHUNK_SIZE])).all())
+        rows.sort(key=lambda row: row[0])
+        for row in rows:
+            self._mark(row[0])
+
+        # IDs below the window are not looked at anymore
+        low = self._max_id - ID_RESCAN_WINDOW
+        self._seen = set([row_id for row_id in self._seen if row_id > low])
+        return rows
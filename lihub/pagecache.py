@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public  License
+# as published by the Free Software Foundation; either version
+# 3.0 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.
+
+"""
+    Caching of rendered pages.
+
+    Every cached page belongs to a tag, like "software/<cid>". The cache key
+    of a page contains the current version of its tag and of the "*" tag,
+    which all pages share. Invalidating a tag gives it a new version, so
+    all of its pages are missed from then on, whatever locale they were
+    rendered for.
+
+    Only pages of anonymous visitors are cached: Flask-Principal loads the
+    identity, and with it the user, at the start of every request of a
+    logged in user, so a cache hit could not spare them the database.
+"""
+
+from uuid import uuid4
+from hashlib import sha1
+from functools import wraps
+
+from flask import request, session, current_app
+from flask.ext.babel import get_locale
+
+from .extensions import cache
+
+ALL_PAGES = "*"
+
+
+def _version_key(tag):
+    return "pagever/%s" % (tag)
+
+
+def _tag_versions(tags):
+    keys = [_version_key(tag) for tag in tags]
+    versions = cache.get_many(*keys)
+    for i, version in enumerate(versions):
+        if version is None:
+            versions[i] = uuid4().hex
+            cache.set(keys[i], versions[i], timeout=0)
+    return versions
+
+
+def invalidate_pages(*tags):
+    """
+    Drop all cached pages of the given tags.
+    """
+
+    for tag in tags:
+        cache.set(_version_key(tag), uuid4().hex, timeout=0)
+
+
+def invalidate_all_pages():
+    invalidate_pages(ALL_PAGES)
+
+
+def software_page_tag(cid):
+    # a software page shows a component together with its SDK
+    if cid.endswith(".sdk"):
+        cid = cid[:-4]
+    return "software/%s" % (cid)
+
+
+def category_page_tag(idname):
+    return "category/%s" % (idname)
+
+
+def _cacheable():
+    if request.method != 'GET':
+        return False
+    # pending messages have to be shown, and are removed from the session doing so
+    if '_flashes' in session:
+        return False
+    if 'user_id' in session:
+        return False
+    # a remembered login is only restored by loading the user
+    cookie_name = current_app.config.get('REMEMBER_COOKIE_NAME', 'remember_token')
+    if cookie_name in request.cookies:
+        return False
+    return True
+
+
+def cached_page(tag):
+    """
+    Cache the page rendered by a view for anonymous visitors, per locale.
+    tag is a function returning the tag of the page from the view's arguments.
+    A cache hit does not touch the database.
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not _cacheable():
+                return f(*args, **kwargs)
+
+            page_tag = tag(**kwargs)
+            versions = _tag_versions([ALL_PAGES, page_tag])
+            key = u"%s/%s/%s/%s" % ("/".join(versions), page_tag, get_locale(), request.full_path)
+            # paths may contain anything, which not every cache backend accepts in keys
+            key = "page/%s" % (sha1(key.encode('utf-8')).hexdigest())
+            page = cache.get(key)
+            if page is None:
+                page = f(*args, **kwargs)
+                cache.set(key, page, timeout=current_app.config.get('PAGE_CACHE_TIMEOUT', 3600))
+            return page
+        return decorated_function
+    return decorator
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public  License
+# as published by the Free Software Foundation; either version
+# 3.0 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.
+
+"""
+    Process-wide cache of rarely changing reference data: categories,
+    repositories and the global settings.
+"""
+
+import threading
+
+from sqlalchemy.orm import joinedload
+
+from .repository.models import Repository, Category, repo_root_dir, repo_data_url_for
+from .admincp.models import GlobalSettings
+
+
+class CategoryInfo(object):
+    """
+    Read-only copy of a Category, detached from the database session.
+    """
+
+    def __init__(self, cat):
+        self.id = cat.id
+        self.idname = cat.idname
+        self.name = cat.name
+        self.description = cat.description
+        self.parent_id = cat.parent_id
+        self.parent = None
+        self.subcategories = list()
+
+    def is_toplevel(self):
+        return not self.subcategories
+
+
+class RepositoryInfo(object):
+    """
+    Read-only copy of a Repository, detached from the database session.
+    """
+
+    def __init__(self, repo):
+        self.id = repo.id
+        self.name = repo.name
+        self.toplevel = repo.toplevel
+        self.flag = repo.flag
+        self.user_id = repo.user_id
+        self.owner_name = repo.user.name if repo.user else None
+        self._root_dir = None
+
+    @property
+    def root_dir(self):
+        if not self._root_dir:
+            self._root_dir = repo_root_dir(self.name, self.toplevel, self.owner_name)
+        return self._root_dir
+
+    def data_url_for(self, filename):
+        return repo_data_url_for(self.name, filename)
+
+
+class ReferenceData(object):
+    """
+    Loads all reference tables with a few queries on first use, and answers
+    lookups from memory afterwards. Must be invalidated whenever one of
+    the tables is written to.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+
+    def _load(self):
+        categories = dict()
+        for cat in Category.query.all():
+            categories[cat.id] = CategoryInfo(cat)
+        for cat in categories.values():
+            if cat.parent_id:
+                cat.parent = categories.get(cat.parent_id)
+                if cat.parent:
+                    cat.parent.subcategories.append(cat)
+        for cat in categories.values():
+            cat.subcategories.sort(key=lambda c: c.id)
+
+        repos = dict()
+        for repo in Repository.query.options(joinedload(Repository.user)).all():
+            repos[repo.id] = RepositoryInfo(repo)
+
+        conf = GlobalSettings.query.first()
+        settings = dict()
+        if conf:
+            settings['allow_registration'] = conf.allow_registration
+
+        return dict(categories=categories,
+                    categories_by_idname=dict((c.idname, c) for c in categories.values()),
+                    repos=repos,
+                    repos_by_name=dict((r.name, r) for r in repos.values()),
+                    settings=settings)
+
+    def _get(self):
+        data = self._data
+        if data is None:
+            with self._lock:
+                if self._data is None:
+                    self._data = self._load()
+                data = self._data
+        return data
+
+    def invalidate(self):
+        with self._lock:
+            self._data = None
+
+    def category(self, idname):
+        return self._get()['categories_by_idname'].get(idname)
+
+    def category_by_id(self, cat_id):
+        return self._get()['categories'].get(cat_id)
+
+    def toplevel_categories(self):
+        cats = [c for c in self._get()['categories'].values() if not c.parent_id]
+        return sorted(cats, key=lambda c: c.id)
+
+    def repository(self, name):
+        return self._get()['repos_by_name'].get(name)
+
+    def repository_by_id(self, repo_id):
+        return self._get()['repos'].get(repo_id)
+
+    def setting(self, name, default=None):
+        value = self._get()['settings'].get(name)
+        return default if value is None else value
+
+
+refdata = ReferenceData()
@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
 
-from .models import Repository, RepoPermission, Category, Package, Component
+from .models import Repository, RepoPermission, Category, Package, Component, IndexState
 from .views import repository
 from .constants import RepoFlag
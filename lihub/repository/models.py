@@ -17,6 +17,7 @@
 
 import os
 from sqlalchemy import Column, Table, types
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.mutable import Mutable
 from flask import current_app
 
@@ -25,6 +26,21 @@ from ..utils import make_dir, get_current_time, STRING_LEN
 
 from .constants import RepoFlag, PackageKind
 
+def repo_root_dir(name, toplevel, owner_name):
+    main_root = current_app.config['REPOS_ROOT']
+    path = None
+    if toplevel:
+        path = os.path.join(main_root, name)
+    else:
+        path = os.path.join(main_root, "users", owner_name, name)
+    make_dir(path)
+    return path
+
+
+def repo_data_url_for(name, filename):
+    return "%s/%s/%s" % (current_app.config['REPOS_ROOT_URL'], name, filename)
+
+
 class Repository(db.Model):
 
     __tablename__ = 'repositories'
@@ -41,17 +57,10 @@ class Repository(db.Model):
 
     @property
     def root_dir(self):
-        main_root = current_app.config['REPOS_ROOT']
-        path = None
-        if self.toplevel:
-            path = os.path.join(main_root, self.name)
-        else:
-            path = os.path.join(main_root, "users", self.user.name, self.name)
-        make_dir(path)
-        return path
+        return repo_root_dir(self.name, self.toplevel, None if self.toplevel else self.user.name)
 
     def data_url_for (self, filename):
-        return "%s/%s/%s" % (current_app.config['REPOS_ROOT_URL'], self.name, filename)
+        return repo_data_url_for(self.name, filename)
 
 
 class RepoPermission(db.Model):
@@ -86,6 +95,10 @@ class Category(db.Model):
 class Package(db.Model):
 
     __tablename__ = 'packages'
+    __table_args__ = (
+        db.UniqueConstraint('repository_id', 'sha256sum'),
+        db.UniqueConstraint('repository_id', 'name', 'version', 'architecture'),
+    )
 
     id = Column(db.Integer, primary_key=True)
     name = Column(db.String(), nullable=False)
@@ -95,6 +108,8 @@ class Package(db.Model):
     kind = Column(db.Integer, default=PackageKind.COMMON)
 
     dependencies = Column(db.String(), nullable=True)
+    # comma separated sizes of the extracted icon, recorded at import time
+    icon_sizes = Column(db.String(), nullable=True)
 
     created_time = Column(db.DateTime, default=get_current_time)
 
@@ -115,6 +130,10 @@ component_categories = Table('component_categories', db.Model.metadata,
 class Component(db.Model):
 
     __tablename__ = 'components'
+    __table_args__ = (
+        # category pages seek through components in this order
+        db.Index('ix_components_repository_name', 'repository_id', 'name', 'id'),
+    )
 
     id = Column(db.Integer, primary_key=True)
     cid = Column(db.String(), nullable=False)
@@ -132,8 +151,65 @@ class Component(db.Model):
     url = Column(db.String(), nullable=True)
 
     xml = Column(db.String(), nullable=False)
+    # the component in distro XML format, ready to be written to the indices
+    xml_fragment = Column(db.String(), nullable=True)
 
     repository_id = Column(db.Integer, db.ForeignKey("repositories.id"))
     repository = db.relationship("Repository", uselist=False, backref="components")
 
     categories = db.relationship('Category', secondary=component_categories, backref='components')
+
+
+class IndexState(db.Model):
+    """
+    Tracks changes to the packages of one architecture in a repository,
+    so only outdated indices need to be rebuilt.
+    """
+
+    __tablename__ = 'index_states'
+    __table_args__ = (
+        db.UniqueConstraint('repository_id', 'architecture'),
+    )
+
+    id = Column(db.Integer, primary_key=True)
+    repository_id = Column(db.Integer, db.ForeignKey("repositories.id"), nullable=False)
+    repository = db.relationship("Repository", uselist=False, backref="index_states")
+    architecture = Column(db.String(), nullable=False)
+
+    # bumped on every change, built_generation is the one the current index reflects
+    generation = Column(db.Integer, default=1, nullable=False)
+    built_generation = Column(db.Integer, default=0, nullable=False)
+    built_time = Column(db.DateTime, nullable=True)
+
+    @property
+    def is_stale(self):
+        return self.generation != self.built_generation
+
+    @classmethod
+    def ensure(cls, repo_id, arch):
+        """
+        Create the state of an architecture, unless it exists already.
+
+        Importers running at the same time may both add the first package
+        of an architecture, so the row is inserted in a savepoint of its
+        own, and losing that race is fine.
+        """
+
+        if cls.query.filter_by(repository_id=repo_id, architecture=arch).first():
+            return
+        savepoint = db.session.begin_nested()
+        try:
+            db.session.add(cls(repository_id=repo_id, architecture=arch, generation=1, built_generation=0))
+            savepoint.commit()
+        except IntegrityError:
+            savepoint.rollback()
+
+    @classmethod
+    def mark_changed(cls, repo_id, arch):
+        state = cls.query.filter_by(repository_id=repo_id, architecture=arch).first()
+        if state:
+            state.generation = cls.generation + 1
+        else:
+            state = cls(repository_id=repo_id, architecture=arch, generation=1, built_generation=0)
+            db.session.add(state)
+        return state
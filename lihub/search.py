@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 Matthias Klumpp <mak@debian.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public  License
+# as published by the Free Software Foundation; either version
+# 3.0 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public
+# License along with this program.
+
+"""
+    In-process full-text search over the components of the master repository.
+"""
+
+import re
+import math
+import heapq
+import threading
+
+from flask.ext.sqlalchemy import Pagination
+
+from .extensions import db
+from .repository.models import Component
+from .refdata import refdata
+from .newrows import NewRowTracker
+
+# weight of a term occurrence, per component field
+FIELD_WEIGHTS = (('name', 3.0),
+                 ('cid', 2.0),
+                 ('summary', 1.5),
+                 ('developer_name', 1.0),
+                 ('description', 1.0))
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# score factor of terms which only matched with a typo
+TYPO_PENALTY = 0.5
+# terms shorter than this have to match exactly
+TYPO_MIN_LENGTH = 4
+
+# documents taken from the postings of each matching term as candidates
+# for the first result pages
+MAX_CANDIDATE_POSTINGS = 2000
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_TAG_RE = re.compile(r'<[^>]+>')
+
+
+def tokenize(text):
+    if not text:
+        return list()
+    return [t for t in _TOKEN_RE.findall(text.lower()) if len(t) > 1]
+
+
+def _deletes(term):
+    return set([term[:i] + term[i+1:] for i in range(len(term))])
+
+
+def _within_one_edit(a, b):
+    """
+    Return True if a and b differ by at most one insertion, deletion,
+    substitution or transposition of adjacent characters.
+    """
+
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) < len(b):
+        return a[i:] == b[i+1:]
+    if a[i+1:] == b[i+1:]:
+        return True
+    return i + 1 < len(a) and a[i] == b[i+1] and a[i+1] == b[i] and a[i+2:] == b[i+2:]
+
+
+class SearchHit(object):
+    def __init__(self, cid, name, summary, score):
+        self.cid = cid
+        self.name = name
+        self.summary = summary
+        self.score = score
+
+
+class _Document(object):
+    def __init__(self, cid, name, summary, tf):
+        self.cid = cid
+        self.name = name
+        self.summary = summary
+        self.tf = tf
+        self.length = sum(tf.values())
+
+
+class ComponentSearch(object):
+    """
+    Inverted index over name, ID, summary, developer and description of the
+    master repository's components, ranked with BM25 and tolerant to one
+    typo per query term.
+
+    The importer adds one component row per package, so documents are keyed
+    by component ID and hold the text of the newest row. Like the completer,
+    the index is updated incrementally: when the cache generation changes,
+    only the rows imported since the last update are read.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._docs = dict()
+        # term -> {cid: weighted frequency}
+        self._postings = dict()
+        # maps every term with one character removed to the terms it came from
+        self._neighbours = dict()
+        self._total_length = 0.0
+        # term -> postings scored for it, best first
+        self._ranked = dict()
+        self._rows = NewRowTracker(Component.id)
+        self._stale = True
+
+    def _add_term(self, term):
+        self._postings[term] = dict()
+        if len(term) >= TYPO_MIN_LENGTH:
+            for d in _deletes(term):
+                self._neighbours.setdefault(d, set()).add(term)
+
+    def _remove_term(self, term):
+        del self._postings[term]
+        if len(term) >= TYPO_MIN_LENGTH:
+            for d in _deletes(term):
+                terms = self._neighbours[d]
+                terms.discard(term)
+                if not terms:
+                    del self._neighbours[d]
+
+    def _insert(self, doc):
+        old = self._docs.get(doc.cid)
+        if old:
+            for term in old.tf.keys():
+                postings = self._postings[term]
+                del postings[old.cid]
+                if not postings:
+                    self._remove_term(term)
+            self._total_length -= old.length
+
+        for term, freq in doc.tf.items():
+            if term not in self._postings:
+                self._add_term(term)
+            self._postings[term][doc.cid] = freq
+        self._total_length += doc.length
+        self._docs[doc.cid] = doc
+
+    def _update(self):
+        mrepo = refdata.repository("master")
+        if not mrepo:
+            return
+        query = db.session.query(Component.id, Component.cid, Component.name, Component.summary,
+                                 Component.description, Component.developer_name) \
+                          .filter(Component.repository_id == mrepo.id, Component.sdk == False) \
+                          .order_by(Component.id)
+        rows = self._rows.fetch_new(query)
+        if not rows:
+            return
+
+        for row in rows:
+            fields = dict(cid=row.cid, name=row.name, summary=row.summary,
+                          developer_name=row.developer_name,
+                          description=_TAG_RE.sub(' ', row.description or ''))
+            tf = dict()
+            for field, weight in FIELD_WEIGHTS:
+                for term in tokenize(fields[field]):
+                    tf[term] = tf.get(term, 0.0) + weight
+            self._insert(_Document(row.cid, row.name, row.summary, tf))
+        self._ranked = dict()
+
+    def invalidate(self):
+        self._stale = True
+
+    def _top_postings(self, term, avg_length):
+        """
+        Return the IDs of the MAX_CANDIDATE_POSTINGS components the term
+        weighs most in.
+        """
+
+        ranked = self._ranked.get(term)
+        if ranked is None:
+            def impact(posting):
+                cid, freq = posting
+                norm = BM25_K1 * (1.0 - BM25_B + BM25_B * self._docs[cid].length / avg_length)
+                return -freq / (freq + norm)
+            postings = sorted(self._postings[term].items(), key=impact)[:MAX_CANDIDATE_POSTINGS]
+            ranked = [cid for cid, freq in postings]
+            self._ranked[term] = ranked
+        return ranked
+
+    def _expand(self, term):
+        """
+        Return (term, factor) pairs of the indexed terms matching a query term.
+        """
+
+        matches = list()
+        if term in self._postings:
+            matches.append((term, 1.0))
+        if len(term) < TYPO_MIN_LENGTH:
+            return matches
+
+        candidates = set(self._neighbours.get(term, []))
+        for d in _deletes(term):
+            if d in self._postings:
+                candidates.add(d)
+            candidates.update(self._neighbours.get(d, []))
+        for cand in candidates:
+            if cand != term and _within_one_edit(term, cand):
+                matches.append((cand, TYPO_PENALTY))
+        return matches
+
+    def search(self, query, page=1, per_page=20):
+        """
+        Return a Pagination of SearchHit objects for the query.
+
+        Only the components each matching term weighs most in are scored,
+        with all terms of the query, as long as they fill the requested
+        page; pages beyond them score every matching component.
+        """
+
+        page = max(1, page)
+        with self._lock:
+            if self._stale:
+                self._stale = False
+                self._update()
+
+            ndocs = len(self._docs)
+            if not ndocs:
+                return Pagination(None, page, per_page, 0, [])
+            avg_length = self._total_length / ndocs
+
+            # the indexed variants of each query term, with their weight
+            query_terms = list()
+            matching = set()
+            candidates = set()
+            for qterm in set(tokenize(query)):
+                variants = list()
+                for term, factor in self._expand(qterm):
+                    postings = self._postings[term]
+                    idf = math.log(1.0 + (ndocs - len(postings) + 0.5) / (len(postings) + 0.5))
+                    variants.append((postings, factor * idf))
+                    matching.update(postings.keys())
+                    candidates.update(self._top_postings(term, avg_length))
+                if variants:
+                    query_terms.append(variants)
+            if len(candidates) < min(page * per_page, len(matching)):
+                candidates = matching
+
+            docs = self._docs
+            scores = dict()
+            for cid in candidates:
+                norm = BM25_K1 * (1.0 - BM25_B + BM25_B * docs[cid].length / avg_length)
+                score = 0.0
+                for variants in query_terms:
+                    # a document counts only the best variant of each query term
+                    best = 0.0
+                    for postings, weight in variants:
+                        freq = postings.get(cid)
+                        if freq:
+                            best = max(best, weight * freq * (BM25_K1 + 1.0) / (freq + norm))
+                    score += best
+                scores[cid] = score
+
+            top = heapq.nsmallest(page * per_page, scores.items(),
+                                  key=lambda s: (-s[1], docs[s[0]].name.lower(), s[0]))
+            items = list()
+            for cid, score in top[(page - 1) * per_page:]:
+                doc = docs[cid]
+                items.append(SearchHit(cid, doc.name, doc.summary, score))
+        return Pagination(None, page, per_page, len(matching), items)
+
+
+component_search = ComponentSearch()
@@ -30,6 +30,8 @@ from ..user import User
 from ..utils import allowed_file, make_dir
 from .forms import ProfileForm, PasswordForm, PGPKeyImportForm
 from ..repository import Repository
+from ..pagecache import invalidate_all_pages
+from ..cachegen import cache_generation
 
 
 settings = Blueprint('settings', __name__, url_prefix='/settings')
@@ -74,6 +76,9 @@ def profile():
 
         db.session.add(user)
         db.session.commit()
+        # names and avatars of developers are shown on cached pages
+        invalidate_all_pages()
+        cache_generation.bump()
 
         flash('Public profile updated.', 'success')
 
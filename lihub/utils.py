@@ -24,8 +24,10 @@ import os
 import sys
 import shlex
 import subprocess
+import re
 import string
 import random
+import gzip
 
 from datetime import datetime
 
@@ -119,6 +121,20 @@ def make_dir(dir_path):
         raise e
 
 
+def open_gzip_writer(fname):
+    """
+    Open a gzip stream for writing. The header contains neither a file
+    name nor a timestamp, so identical content gives identical files.
+    """
+    return gzip.GzipFile(filename='', mode='wb', fileobj=open(fname, 'wb'), mtime=0)
+
+
+def close_gzip_writer(gz):
+    fileobj = gz.fileobj
+    gz.close()
+    fileobj.close()
+
+
 def run_command(command, input=None):
     if not isinstance(command, list):
         command = shlex.split(command)
@@ -163,3 +179,54 @@ def build_cpt_path(cptid):
         gid = "%s/%s/%s" % (cptid[0].lower(), cptid[:2].lower(), cptid)
 
     return gid
+
+
+# icon sizes shown on the web pages, in order of preference
+ICON_SIZES = ["64x64", "128x128"]
+
+
+def icon_path(pkgname, version, size):
+    """
+    Return the path of a package's icon, relative to its repository root.
+    """
+
+    return os.path.join("assets", build_cpt_path(pkgname), version, "icons", size,
+                        "%s-%s.png" % (pkgname, version))
+
+
+def find_icon_sizes(repo_root, pkgname, version):
+    """
+    Return the sizes the icon of a package was extracted in.
+    """
+
+    icons_dir = os.path.join(repo_root, "assets", build_cpt_path(pkgname), version, "icons")
+    if not os.path.isdir(icons_dir):
+        return list()
+    return sorted([size for size in os.listdir(icons_dir)
+                   if os.path.isfile(os.path.join(repo_root, icon_path(pkgname, version, size)))])
+
+
+def index_shard(cptid):
+    """
+    Return the name of the index shard a component belongs to, the first
+    two levels of its build_cpt_path.
+    """
+
+    return "/".join(build_cpt_path(cptid).split("/")[:2])
+
+
+_XML_DECL_RE = re.compile(r'^\s*<\?xml[^>]*\?>\s*')
+_COMPONENTS_RE = re.compile(r'^\s*<components\b[^>]*>(.*)</components>\s*$', re.DOTALL)
+
+
+def xml_fragment(xml):
+    """
+    Strip the XML declaration and an enclosing <components/> element from
+    an AppStream document, so its components can be embedded in another one.
+    """
+
+    xml = _XML_DECL_RE.sub('', xml)
+    m = _COMPONENTS_RE.match(xml)
+    if m:
+        xml = m.group(1)
+    return xml.strip()
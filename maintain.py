@@ -15,22 +15,51 @@
 # You should have received a copy of the GNU General Public
 # License along with this program.
 
+import json
+import argparse
+
 from lihub import create_app
 from lihub.maintain.ipkimport import *
 from lihub.maintain.update_indices import *
+from lihub.maintain.watch import IncomingWatcher
+from lihub.maintain.stats import ImportStats
 from lihub.extensions import db
 
 app = create_app()
 db.init_app(app)
 
 def main():
+    parser = argparse.ArgumentParser(description="Import new packages and update the repository indices.")
+    parser.add_argument('command', nargs='?', choices=['import', 'watch'], default='import',
+                        help="import once and exit, or keep watching the incoming directory")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="number of worker processes used to import packages and build indices")
+    parser.add_argument('--force', action='store_true',
+                        help="rebuild the indices of all repositories, not only the outdated ones")
+    parser.add_argument('--debounce', type=int, default=30,
+                        help="seconds without new uploads before indices are rebuilt in watch mode")
+    parser.add_argument('--max-delay', type=int, default=300,
+                        help="seconds after which indices are rebuilt in watch mode, even if uploads keep coming in")
+    args = parser.parse_args()
+
     incoming_dir = app.config['PKG_INCOMING_DIR']
     with app.app_context():
         imp = IPKImporter(incoming_dir)
-        imp.import_packages()
+        if args.command == 'watch':
+            watcher = IncomingWatcher(imp, IndicesUpdater(jobs=max(1, args.jobs)), incoming_dir,
+                                      jobs=max(1, args.jobs), debounce=args.debounce,
+                                      max_delay=args.max_delay)
+            watcher.run()
+            return
+
+        imp.import_packages(jobs=max(1, args.jobs))
+
+        idx = IndicesUpdater(jobs=max(1, args.jobs))
+        with imp.stats.stage('indices'):
+            idx.rebuild_indices(force=args.force)
+        imp.remove_unused_blobs()
 
-        idx = IndicesUpdater()
-        idx.rebuild_indices()
+        print(json.dumps(imp.stats.save(), sort_keys=True))
 
 
 if __name__ == "__main__":
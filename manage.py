@@ -21,8 +21,12 @@ from flask.ext.script import Manager
 from lihub import create_app
 from lihub.extensions import db
 from lihub.user import User, UserDetail, user_datastore
-from lihub.repository import Repository, RepoPermission, Category, RepoFlag
-from lihub.utils import MALE, OTHER
+from lihub.repository import Repository, RepoPermission, Category, Package, RepoFlag
+from lihub.utils import MALE, OTHER, find_icon_sizes
+from lihub.refdata import refdata
+from lihub.cachegen import cache_generation
+# register the tables of the maintenance tools
+import lihub.maintain
 
 try:
     from lihub.local_config import DefaultConfig
@@ -145,6 +149,17 @@ def initdb():
     db.session.add(Category(idname="arcade", name="Arcade", description="Arcade Games", parent=cat_games))
 
     db.session.commit()
+    refdata.invalidate()
+    cache_generation.bump()
+
+
+@manager.command
+def iconmanifest():
+    """Record the icon sizes of packages imported before they were tracked."""
+
+    for pkg in Package.query.filter(Package.icon_sizes == None):
+        pkg.icon_sizes = ",".join(find_icon_sizes(pkg.repository.root_dir, pkg.name, pkg.version))
+    db.session.commit()
 
 
 manager.add_option('-c', '--config',
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from lihub.extensions import db
+from lihub.repository import Category
+from lihub.autocomplete import PrefixTree, Completion
+from lihub.newrows import NewRowTracker
+
+from tests import TestCase
+
+
+class TestPrefixTree(unittest.TestCase):
+
+    def _add(self, tree, cid, name, count):
+        entry = Completion(cid, name)
+        entry.count = count
+        tree.insert(cid.lower(), entry)
+        tree.insert(name.lower(), entry)
+        return entry
+
+    def test_complete(self):
+        tree = PrefixTree()
+        self._add(tree, u'org.kde.kate', u'Kate', 5)
+        self._add(tree, u'org.kde.kwrite', u'KWrite', 2)
+        self._add(tree, u'org.gnome.gedit', u'gedit', 9)
+
+        assert [c.cid for c in tree.complete(u'org.', 10)] == \
+            [u'org.gnome.gedit', u'org.kde.kate', u'org.kde.kwrite']
+        assert [c.cid for c in tree.complete(u'org.kde.k', 10)] == [u'org.kde.kate', u'org.kde.kwrite']
+        assert [c.cid for c in tree.complete(u'k', 1)] == [u'org.kde.kate']
+        assert tree.complete(u'org.kx', 10) == []
+
+    def test_popularity_update(self):
+        tree = PrefixTree()
+        kate = self._add(tree, u'org.kde.kate', u'Kate', 1)
+        self._add(tree, u'org.kde.kwrite', u'KWrite', 2)
+        assert tree.complete(u'org.kde', 1)[0].cid == u'org.kde.kwrite'
+
+        kate.count = 3
+        tree.insert(u'org.kde.kate', kate)
+        assert tree.complete(u'org.kde', 1)[0].cid == u'org.kde.kate'
+
+
+class TestNewRowTracker(TestCase):
+
+    def _add_category(self, cat_id):
+        db.session.add(Category(id=cat_id, idname=u'cat%i' % cat_id, name=u'Category', description=u''))
+        db.session.commit()
+
+    def test_late_commit_with_lower_id(self):
+        tracker = NewRowTracker(Category.id)
+        query = db.session.query(Category.id, Category.idname).order_by(Category.id)
+
+        self._add_category(5)
+        self._add_category(10)
+        assert [row[0] for row in tracker.fetch_new(query)] == [5, 10]
+        assert tracker.fetch_new(query) == []
+
+        # a transaction holding a lower ID commits after the higher one was seen
+        self._add_category(7)
+        self._add_category(11)
+        assert [row[0] for row in tracker.fetch_new(query)] == [7, 11]
+        assert tracker.fetch_new(query) == []
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+from hashlib import sha256
+
+from lihub.maintain.blobstore import BlobStore, BlobValidationError
+
+
+class TestBlobStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.blobs = BlobStore(os.path.join(self.tmp_dir, "blobs"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _upload(self, fname, data):
+        fname = os.path.join(self.tmp_dir, fname)
+        with open(fname, 'wb') as f:
+            f.write(data)
+        return fname, sha256(data).hexdigest()
+
+    def test_add_file(self):
+        fname, sha256sum = self._upload("a.ipk", "payload")
+        self.assertRaises(BlobValidationError, self.blobs.add_file, fname, sha256sum, 3)
+        self.blobs.add_file(fname, sha256sum, 7)
+        assert self.blobs.has(sha256sum)
+
+        pool_fname = os.path.join(self.tmp_dir, "pool", "a.ipk")
+        self.blobs.link_to(sha256sum, pool_fname)
+        assert os.path.samefile(pool_fname, self.blobs.path_for(sha256sum))
+
+    def test_remove_unreferenced(self):
+        fname, used = self._upload("a.ipk", "used")
+        self.blobs.add_file(fname, used)
+        fname, unused = self._upload("b.ipk", "unused")
+        self.blobs.add_file(fname, unused)
+
+        # recently added blobs may belong to an import which is still running
+        assert self.blobs.remove_unreferenced(set([used]), 3600) == 0
+        assert self.blobs.remove_unreferenced(set([used]), -1) == 1
+        assert self.blobs.has(used)
+        assert not self.blobs.has(unused)
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import threading
+
+from flask import current_app
+
+from lihub.extensions import db
+from lihub.repository import Category
+from lihub.refdata import refdata
+from lihub.cachegen import CacheGeneration, cache_generation
+
+from tests import TestCase
+
+
+class TestCacheGeneration(TestCase):
+
+    def setUp(self):
+        super(TestCacheGeneration, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        current_app.config['CACHE_GENERATION_FILE'] = os.path.join(self.tmp_dir, 'cache-generation')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        super(TestCacheGeneration, self).tearDown()
+
+    def test_changed(self):
+        web = CacheGeneration()
+        importer = CacheGeneration()
+        # nothing was cached before the first check
+        assert not web.changed()
+
+        importer.bump()
+        assert web.changed()
+        assert not web.changed()
+
+        importer.bump()
+        importer.bump()
+        assert web.changed()
+        assert not importer.changed()
+
+    def test_concurrent_bumps(self):
+        # separate instances do not share their thread lock, like processes
+        def bump():
+            with self.app.app_context():
+                generation = CacheGeneration()
+                for i in range(20):
+                    generation.bump()
+
+        threads = [threading.Thread(target=bump) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        with open(current_app.config['CACHE_GENERATION_FILE']) as f:
+            assert int(f.read()) == 80
+
+    def test_request_drops_reference_data(self):
+        cache_generation.changed()
+        refdata.invalidate()
+        assert refdata.category(u'games') is None
+
+        db.session.add(Category(idname=u'games', name=u'Games', description=u''))
+        db.session.commit()
+        self.client.get('/')
+        assert refdata.category(u'games') is None
+
+        cache_generation.bump()
+        self.client.get('/')
+        assert refdata.category(u'games') is not None
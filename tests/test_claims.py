@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import shutil
+import tempfile
+import subprocess
+from hashlib import sha256
+
+from lihub.extensions import db
+from lihub.maintain.claims import WorkClaims, CLAIM_TIMEOUT
+from lihub.maintain.blobstore import BlobStore
+from lihub.maintain.dscfile import DSCFile, DscFileException
+from lihub.maintain.models import ImportJournalEntry
+from lihub.maintain.constants import ImportState
+
+from tests import TestCase
+
+
+def _dead_pid():
+    proc = subprocess.Popen(["true"])
+    proc.wait()
+    return proc.pid
+
+
+class TestWorkClaims(TestCase):
+
+    def setUp(self):
+        super(TestWorkClaims, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.incoming_dir = os.path.join(self.tmp_dir, "incoming")
+        self.morgue_dir = os.path.join(self.tmp_dir, "morgue")
+        os.makedirs(self.incoming_dir)
+        self.blobs = BlobStore(os.path.join(self.tmp_dir, "blobs"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        super(TestWorkClaims, self).tearDown()
+
+    def _claims(self, worker_id=None):
+        claims = WorkClaims(self.incoming_dir, self.morgue_dir, self.blobs)
+        if worker_id:
+            claims.worker_id = worker_id
+            claims.claim_dir = os.path.join(self.incoming_dir, ".claims", worker_id)
+        return claims
+
+    def _upload(self, name, data="payload"):
+        with open(os.path.join(self.incoming_dir, name + ".ipk"), 'w') as f:
+            f.write(data)
+        dscfile = os.path.join(self.incoming_dir, name + ".dsc")
+        with open(dscfile, 'w') as f:
+            f.write("Target: master\nFiles:\n %s %i %s.ipk\n" % (sha256(data).hexdigest(), len(data), name))
+        return dscfile
+
+    def test_claim_once(self):
+        dscfile = self._upload("app")
+        first = self._claims("host-1")
+        second = self._claims("host-2")
+
+        claimed = first.claim(dscfile)
+        assert claimed == os.path.join(first.claim_dir, "app.dsc")
+        assert os.path.isfile(os.path.join(first.claim_dir, "app.ipk"))
+        assert second.claim(dscfile) is None
+
+        first.done(claimed)
+        assert os.listdir(first.claim_dir) == []
+
+    def test_release(self):
+        claims = self._claims()
+        claimed = claims.claim(self._upload("app"))
+        claims.release(claimed)
+        assert sorted(os.listdir(self.incoming_dir)) == [".claims", "app.dsc", "app.ipk"]
+        assert os.listdir(claims.claim_dir) == []
+
+        # a failed import returns everything it still holds
+        claims.claim(os.path.join(self.incoming_dir, "app.dsc"))
+        claims.claim(self._upload("other", "other payload"))
+        claims.release_all()
+        assert sorted(os.listdir(self.incoming_dir)) == [".claims", "app.dsc", "app.ipk", "other.dsc", "other.ipk"]
+
+    def test_referenced_payloads(self):
+        claims = self._claims()
+        self._upload("waiting", "waiting payload")
+        claims.claim(self._upload("claimed", "claimed payload"))
+        claims.reject(claims.claim(self._upload("rejected", "rejected payload")))
+        claims.done(claims.claim(self._upload("done", "done payload")))
+        assert claims.referenced_payloads() == \
+            set([sha256(data).hexdigest() for data in ("waiting payload", "claimed payload", "rejected payload")])
+
+    def test_invalid_file_names(self):
+        outside = os.path.join(self.tmp_dir, "outside")
+        with open(outside, 'w') as f:
+            f.write("data")
+        for name in ("../outside", outside, ".."):
+            dscfile = os.path.join(self.incoming_dir, "evil.dsc")
+            with open(dscfile, 'w') as f:
+                f.write("Files:\n %s 4 %s\n" % (sha256("data").hexdigest(), name))
+            dsc = DSCFile()
+            dsc.open(dscfile)
+            self.assertRaises(DscFileException, dsc.get_file_entries)
+
+            claims = self._claims()
+            assert claims.claim(dscfile) is None
+            assert claims.reject_invalid(dscfile)
+            assert os.path.isfile(outside)
+            assert os.listdir(self.morgue_dir) == ["evil.dsc"]
+            os.remove(os.path.join(self.morgue_dir, "evil.dsc"))
+
+    def test_reject_keeps_payload(self):
+        claims = self._claims()
+        claimed = claims.claim(self._upload("app"))
+
+        # the importer moved the payload into the blob store before rejecting it
+        self.blobs.add_file(os.path.join(claims.claim_dir, "app.ipk"), sha256("payload").hexdigest())
+
+        claims.reject(claimed)
+        assert sorted(os.listdir(self.morgue_dir)) == ["app.dsc", "app.ipk"]
+        with open(os.path.join(self.morgue_dir, "app.ipk")) as f:
+            assert f.read() == "payload"
+
+    def test_recover_stale(self):
+        crashed = self._claims("%s-%i" % (self._claims()._hostname, _dead_pid()))
+        crashed.claim(self._upload("app"))
+        imported = crashed.claim(self._upload("done", "other payload"))
+
+        dsc = DSCFile()
+        dsc.open(imported)
+        db.session.add(ImportJournalEntry(dsc_sha256=dsc.sha256sum, dsc_name=u"done.dsc",
+                                          state=ImportState.IMPORTED))
+        db.session.commit()
+
+        self._claims().recover_stale()
+        # imported uploads are not handed out a second time
+        assert sorted(os.listdir(self.incoming_dir)) == [".claims", "app.dsc", "app.ipk"]
+        assert os.listdir(os.path.join(self.incoming_dir, ".claims")) == []
+
+    def test_heartbeat(self):
+        remote = self._claims("otherhost-1")
+        remote.claim(self._upload("app"))
+        old = time.time() - CLAIM_TIMEOUT - 60
+        os.utime(remote.claim_dir, (old, old))
+
+        # a worker sending heartbeats keeps its claims
+        remote.heartbeat()
+        self._claims().recover_stale()
+        assert os.path.isfile(os.path.join(remote.claim_dir, "app.dsc"))
+
+        os.utime(remote.claim_dir, (old, old))
+        self._claims().recover_stale()
+        assert os.path.isfile(os.path.join(self.incoming_dir, "app.dsc"))
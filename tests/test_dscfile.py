@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from lihub.maintain.dscfile import DSCFile, UPLOAD_SETTLE_TIME
+
+
+class TestDSCFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _dsc(self, files):
+        fname = os.path.join(self.tmp_dir, "app.dsc")
+        with open(fname, 'w') as f:
+            f.write("Target: master\nFiles:\n%s\n" % ("\n".join([" " + l for l in files])))
+        dsc = DSCFile()
+        dsc.open(fname)
+        return dsc
+
+    def _write(self, fname, data, age=0):
+        fname = os.path.join(self.tmp_dir, fname)
+        with open(fname, 'w') as f:
+            f.write(data)
+        mtime = time.time() - age
+        os.utime(fname, (mtime, mtime))
+
+    def test_files_complete_with_size(self):
+        dsc = self._dsc(["%064x 4 app.ipk" % 1])
+        assert not dsc.files_complete(self.tmp_dir)
+        self._write("app.ipk", "ap")
+        assert not dsc.files_complete(self.tmp_dir)
+        self._write("app.ipk", "appx")
+        assert dsc.files_complete(self.tmp_dir)
+
+    def test_files_complete_without_size(self):
+        dsc = self._dsc(["%064x app.ipk" % 1])
+        # the file might still be growing
+        self._write("app.ipk", "ap")
+        assert not dsc.files_complete(self.tmp_dir)
+        self._write("app.ipk", "appx", UPLOAD_SETTLE_TIME + 1)
+        assert dsc.files_complete(self.tmp_dir)
+
+    def test_known_payload(self):
+        dsc = self._dsc(["%064x 4 app.ipk" % 1])
+        assert dsc.files_complete(self.tmp_dir, lambda sha256sum: sha256sum == "%064x" % 1)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+from lihub.maintain import generations
+from lihub.maintain.generations import begin_generation, publish_generation, \
+    prune_generations, current_generation, lock_generations
+
+
+class TestGenerations(unittest.TestCase):
+
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir)
+
+    def _write(self, gen_dir, fname, data):
+        with open(os.path.join(gen_dir, fname), 'w') as f:
+            f.write(data)
+
+    def _read(self, fname):
+        with open(os.path.join(self.root_dir, "indices", fname)) as f:
+            return f.read()
+
+    def test_publish(self):
+        first = begin_generation(self.root_dir)
+        self._write(first, "Index", "1")
+        publish_generation(self.root_dir, first)
+        assert self._read("Index") == "1"
+
+        second = begin_generation(self.root_dir)
+        assert os.path.samefile(os.path.join(first, "Index"), os.path.join(second, "Index"))
+        # files are replaced by renaming, the published one stays untouched
+        self._write(second, "Index.new", "2")
+        os.rename(os.path.join(second, "Index.new"), os.path.join(second, "Index"))
+        assert self._read("Index") == "1"
+
+        publish_generation(self.root_dir, second)
+        assert self._read("Index") == "2"
+        assert current_generation(self.root_dir) == second
+
+    def test_adopt_indices_dir(self):
+        os.makedirs(os.path.join(self.root_dir, "indices"))
+        self._write(os.path.join(self.root_dir, "indices"), "Index", "old")
+        gen_dir = begin_generation(self.root_dir)
+        assert os.path.islink(os.path.join(self.root_dir, "indices"))
+        assert self._read("Index") == "old"
+        assert gen_dir != current_generation(self.root_dir)
+
+    def test_concurrent_begin(self):
+        first = begin_generation(self.root_dir)
+        self._write(first, "Index", "1")
+        publish_generation(self.root_dir, first)
+
+        # another build creates the next generation between listing and creating it
+        real_numbers = generations._generation_numbers
+        taken = list()
+
+        def generation_numbers(gens_dir):
+            numbers = real_numbers(gens_dir)
+            if not taken:
+                taken.append(os.path.join(gens_dir, str(numbers[-1] + 1)))
+                os.mkdir(taken[0])
+            return numbers
+
+        generations._generation_numbers = generation_numbers
+        try:
+            second = begin_generation(self.root_dir)
+        finally:
+            generations._generation_numbers = real_numbers
+        assert second != taken[0]
+        assert os.path.isfile(os.path.join(second, "Index"))
+        assert sorted(os.listdir(os.path.dirname(first))) == ["1", "2", "3"]
+
+    def test_prune(self):
+        gens = list()
+        for i in range(3):
+            gens.append(begin_generation(self.root_dir))
+            publish_generation(self.root_dir, gens[-1])
+        abandoned = begin_generation(self.root_dir)
+
+        # the first generation was replaced long ago, the second one just now
+        old = time.time() - 3600
+        os.utime(gens[1], (old, old))
+        prune_generations(self.root_dir, 60)
+        assert not os.path.exists(gens[0])
+        assert os.path.exists(gens[1])
+        assert os.path.exists(gens[2])
+        assert os.path.exists(abandoned)
+
+        os.utime(abandoned, (old, old))
+        prune_generations(self.root_dir, 60)
+        assert not os.path.exists(abandoned)
+        assert os.path.exists(gens[2])
+
+    def test_lock(self):
+        lock_f = lock_generations(self.root_dir)
+        locked = threading.Event()
+
+        def other_builder():
+            lock_generations(self.root_dir).close()
+            locked.set()
+
+        t = threading.Thread(target=other_builder)
+        t.start()
+        assert not locked.wait(0.2)
+        lock_f.close()
+        t.join()
+        assert locked.is_set()
+        # the lock file is not taken for a generation
+        assert sorted(os.listdir(os.path.join(self.root_dir, "generations"))) == [".lock"]
+        assert begin_generation(self.root_dir).endswith("1")
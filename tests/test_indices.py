@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+from sqlalchemy import event
+
+from lihub.extensions import db
+from lihub.repository import Repository, Package, Component, IndexState
+from lihub.maintain.indexquery import iter_index_rows
+from lihub.maintain.update_indices import IndicesUpdater
+
+from tests import TestCase
+
+
+class TestIndexQuery(TestCase):
+
+    def _add_packages(self, repo, start, count):
+        for i in range(start, start + count):
+            cpt = Component(cid=u'org.example.App%i' % i, kind=u'desktop',
+                            name=u'App %i' % i, summary=u'An app', description=u'<p>An app</p>',
+                            xml=u'<component/>', xml_fragment=u'<component/>',
+                            repository=repo)
+            pkg = Package(name=u'app%i' % i, version=u'1.0', fname=u'pool/app%i.ipk' % i,
+                          architecture=u'amd64', sha256sum=u'%064x' % i,
+                          repository=repo, component=cpt)
+            db.session.add(pkg)
+        db.session.commit()
+
+    def _count_queries(self, func):
+        queries = list()
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            queries.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            func()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return len(queries)
+
+    def test_query_count_does_not_grow(self):
+        repo = Repository(name=u'master', toplevel=True)
+        db.session.add(repo)
+        self._add_packages(repo, 0, 3)
+        repo_id = repo.id
+        db.session.expunge_all()
+
+        small = self._count_queries(lambda: list(iter_index_rows(repo_id, u'amd64', chunk_size=2)))
+
+        self._add_packages(Repository.query.get(repo_id), 3, 40)
+        db.session.expunge_all()
+
+        rows = list()
+        large = self._count_queries(lambda: rows.extend(iter_index_rows(repo_id, u'amd64', chunk_size=2)))
+
+        assert len(rows) == 43
+        assert large == small == 1
+        assert rows[0].cpt_name == u'App 0'
+        assert rows[0].xml is None
+
+
+class TestIndexStates(TestCase):
+
+    def setUp(self):
+        super(TestIndexStates, self).setUp()
+        repo = Repository(name=u'master', toplevel=True)
+        db.session.add(repo)
+        for i, arch in enumerate((u'amd64', u'i386', u'arm64')):
+            cpt = Component(cid=u'org.example.App%i' % i, kind=u'desktop', name=u'App', summary=u'An app',
+                            description=u'<p>An app</p>', xml=u'<component/>', repository=repo)
+            db.session.add(Package(name=u'app%i' % i, version=u'1.0', fname=u'pool/app%i.ipk' % i,
+                                   architecture=arch, sha256sum=u'%064x' % i,
+                                   repository=repo, component=cpt))
+        db.session.commit()
+        self.repo_id = repo.id
+
+        # amd64 changed since it was built, i386 did not, arm64 has no state yet
+        db.session.add(IndexState(repository_id=self.repo_id, architecture=u'amd64',
+                                  generation=2, built_generation=1))
+        db.session.add(IndexState(repository_id=self.repo_id, architecture=u'i386',
+                                  generation=1, built_generation=1))
+        db.session.commit()
+
+    def _selected(self, force):
+        updater = IndicesUpdater()
+        selected = list()
+        updater._build_states = lambda states, force=False: selected.extend(
+            [s.architecture for s in states if force or s.is_stale])
+        updater.rebuild_indices(force=force)
+        return sorted(selected)
+
+    def test_stale_selection(self):
+        assert self._selected(False) == [u'amd64']
+        assert self._selected(True) == [u'amd64', u'arm64', u'i386']
+
+    def test_ensure(self):
+        IndexState.ensure(self.repo_id, u'i386')
+        IndexState.ensure(self.repo_id, u'arm64')
+        IndexState.ensure(self.repo_id, u'arm64')
+        db.session.commit()
+        states = dict((s.architecture, s) for s in IndexState.query.filter_by(repository_id=self.repo_id))
+        assert sorted(states.keys()) == [u'amd64', u'arm64', u'i386']
+        assert not states[u'i386'].is_stale
+        assert states[u'arm64'].is_stale
+
+        IndexState.mark_changed(self.repo_id, u'i386')
+        db.session.commit()
+        assert IndexState.query.filter_by(repository_id=self.repo_id, architecture=u'i386').one().is_stale
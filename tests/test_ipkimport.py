@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+from hashlib import sha256
+
+from flask import current_app
+
+from lihub.extensions import db
+from lihub.user import User
+from lihub.refdata import refdata
+from lihub.repository import Repository, Category, Package
+from lihub.maintain.ipkimport import IPKImporter, _import_job_files
+from lihub.maintain.blobstore import BlobStore
+from lihub.maintain.models import ImportJournalEntry
+from lihub.maintain.constants import ImportState
+from lihub.maintain.stats import ImportStats
+
+from tests import TestCase
+
+CATEGORIES = ("multimedia", "development", "education", "games", "graphics", "network", "customization",
+              "science", "tools", "system", "arcade", "components", "other")
+
+
+class TestIPKImporter(TestCase):
+
+    def setUp(self):
+        super(TestIPKImporter, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.incoming_dir = os.path.join(self.tmp_dir, "incoming")
+        os.makedirs(self.incoming_dir)
+        current_app.config['PKG_MORGUE_DIR'] = os.path.join(self.tmp_dir, "morgue")
+        current_app.config['BLOBS_ROOT'] = os.path.join(self.tmp_dir, "blobs")
+
+        for idname in CATEGORIES:
+            db.session.add(Category(idname=idname, name=idname, description=u''))
+        db.session.add(Repository(name=u'master', toplevel=True))
+        db.session.commit()
+        refdata.invalidate()
+        self.repo = refdata.repository(u'master')
+        self.importer = IPKImporter(self.incoming_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        super(TestIPKImporter, self).tearDown()
+
+    def _package(self, name, version=u'1.0'):
+        # a file placed in the repository for the package
+        written = os.path.join(self.tmp_dir, "%s-%s.ipk" % (name, version))
+        with open(written, 'w') as f:
+            f.write("package")
+        return dict(cid=u'org.example.%s' % name, cpt_kind=u'desktop', xdg_categories=[u'Game'], sdk=False,
+                    cpt_name=name, summary=u'An app', description=u'<p>An app</p>', developer_name=None,
+                    url=None, xml=u'<component/>', xml_fragment=u'<component/>', name=name, version=version,
+                    fname=u'pool/%s.ipk' % name, architecture=u'amd64',
+                    sha256sum=sha256(name + version).hexdigest(), dependencies=None, icon_sizes=u'',
+                    written=[written])
+
+    def _names(self):
+        return sorted([pkg.name for pkg in Package.query.all()])
+
+    def test_upload_is_all_or_nothing(self):
+        good = self._package(u'good')
+        assert self.importer._add_result(dict(packages=[good], rejects=list()), self.repo)
+
+        # one rejected file discards the whole upload, including its placed files
+        partial = self._package(u'partial')
+        result = dict(packages=[partial], rejects=["Validation failed: Checksum mismatch for 'b.ipk'"])
+        assert not self.importer._add_result(result, self.repo)
+        assert not os.path.exists(partial['written'][0])
+
+        # a package existing already rolls back the savepoint of its upload only
+        other = self._package(u'other')
+        duplicate = self._package(u'good')
+        duplicate['sha256sum'] = u'%064x' % 1
+        duplicate['written'] = list()
+        result = dict(packages=[other, duplicate], rejects=list())
+        assert not self.importer._add_result(result, self.repo)
+        assert len(result['rejects']) == 1
+        assert not os.path.exists(other['written'][0])
+
+        db.session.commit()
+        assert self._names() == [u'good']
+        assert os.path.exists(good['written'][0])
+
+    def _upload(self, data="payload"):
+        db.session.add(User(name=u'uploader', email=u'uploader@example.com', password=u'123456',
+                            pgpfpr=u'DEADBEEF'))
+        db.session.commit()
+        with open(os.path.join(self.incoming_dir, "app.ipk"), 'w') as f:
+            f.write(data)
+        dscfile = os.path.join(self.incoming_dir, "app.dsc")
+        with open(dscfile, 'w') as f:
+            f.write("Uploader: Someone <uploader@example.com>\nTarget: master\nFiles:\n %s %i app.ipk\n" %
+                    (sha256(data).hexdigest(), len(data)))
+        return dscfile
+
+    def test_resume_verifies_signature(self):
+        dscfile = self._upload()
+        job, repo = self.importer._prepare_job(dscfile)
+        db.session.add(ImportJournalEntry(dsc_sha256=job['dsc'].sha256sum, dsc_name=u'app.dsc',
+                                          state=ImportState.IMPORTED))
+        db.session.commit()
+
+        # an upload imported by an interrupted run is not imported again...
+        job, repo = self.importer._prepare_job(dscfile)
+        assert job['skip_all']
+
+        # ...but only finished once its signature checked out
+        job['signature'] = (None, "bad signature")
+        result = _import_job_files(job, BlobStore(current_app.config['BLOBS_ROOT']), ImportStats())
+        assert result['rejects'] and not result['packages']
+        assert os.path.isfile(os.path.join(self.incoming_dir, "app.ipk"))
+
+        job['signature'] = (u'DEAD BEEF', None)
+        result = _import_job_files(job, BlobStore(current_app.config['BLOBS_ROOT']), ImportStats())
+        assert not result['rejects'] and not result['packages']
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+from sqlalchemy import event
+
+from lihub import create_app
+from lihub.config import TestConfig
+from lihub.extensions import db
+from lihub.refdata import refdata
+from lihub.repository import Repository, Category, Component, Package
+from lihub.pagecache import invalidate_pages, software_page_tag
+
+from tests import TestCase
+
+
+class CachedTestConfig(TestConfig):
+    CACHE_TYPE = 'simple'
+
+
+class TestPageCache(TestCase):
+
+    def create_app(self):
+        return create_app(CachedTestConfig)
+
+    def setUp(self):
+        super(TestPageCache, self).setUp()
+        repo = Repository(name=u'master', toplevel=True)
+        games = Category(idname=u'games', name=u'Games', description=u'')
+        cpt = Component(cid=u'org.example.Chess', kind=u'desktop', name=u'Chess', summary=u'A game',
+                        description=u'<p>A game</p>', xml=u'<component/>', repository=repo,
+                        categories=[games])
+        db.session.add(Package(name=u'chess', version=u'1.0', fname=u'pool/chess.ipk', architecture=u'amd64',
+                               sha256sum=u'%064x' % 1, repository=repo, component=cpt))
+        db.session.commit()
+        refdata.invalidate()
+
+    def _count_queries(self, url):
+        queries = list()
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            queries.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            self.assert200(self.client.get(url))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return len(queries)
+
+    def test_hit_needs_no_database(self):
+        for url in ('/software/org.example.Chess', '/browse/games'):
+            assert self._count_queries(url) > 0
+            assert self._count_queries(url) == 0
+
+    def test_invalidate_tag(self):
+        self._count_queries('/software/org.example.Chess')
+        self._count_queries('/browse/games')
+
+        invalidate_pages(software_page_tag(u'org.example.Chess'))
+        assert self._count_queries('/software/org.example.Chess') > 0
+        # pages of other tags stay cached
+        assert self._count_queries('/browse/games') == 0
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+from hashlib import sha256
+
+from lihub.maintain import pdiff
+from lihub.maintain.pdiff import ed_script, update_diffs
+
+
+def apply_ed_script(lines, script):
+    lines = list(lines)
+    script = script.splitlines(True)
+    i = 0
+    while i < len(script):
+        cmd = script[i].strip()
+        i += 1
+        op = cmd[-1]
+        addr = [int(n) for n in cmd[:-1].split(",")]
+        text = list()
+        if op in "ac":
+            while script[i] != ".\n":
+                text.append(script[i])
+                i += 1
+            i += 1
+        if op == "a":
+            lines[addr[0]:addr[0]] = text
+        else:
+            lines[addr[0] - 1:addr[-1]] = text
+    return lines
+
+
+class TestPDiff(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_index(self, fname, lines):
+        with gzip.open(os.path.join(self.tmp_dir, fname), 'wb') as f:
+            f.write("".join(lines))
+
+    def test_ed_script(self):
+        old = ["a\n", "b\n", "c\n", "d\n", "e\n"]
+        new = ["a\n", "x\n", "c\n", "e\n", "f\n", "g\n"]
+        assert apply_ed_script(old, ed_script(old, new)) == new
+        assert apply_ed_script([], ed_script([], new)) == new
+        assert ed_script(old, ["a\n", ".\n"]) is None
+
+    def test_history(self):
+        versions = [["pkg%i\n" % i for i in range(n)] for n in (3, 4, 5, 6)]
+        index = os.path.join(self.tmp_dir, "Index.gz")
+        self._write_index("Index.gz", versions[0])
+        for lines in versions[1:]:
+            self._write_index("Index.gz.new", lines)
+            update_diffs(index, index + ".new", 2)
+            os.rename(index + ".new", index)
+
+        diff_dir = os.path.join(self.tmp_dir, "Index.diff")
+        with open(os.path.join(diff_dir, "Index")) as f:
+            manifest = f.read()
+        history = manifest.split("SHA256-History:\n")[1].split("SHA256-Patches:")[0].splitlines()
+        assert len(history) == 2
+        assert len(os.listdir(diff_dir)) == 3
+
+        # a client holding the oldest remembered version catches up
+        lines = versions[1]
+        for entry in history:
+            with gzip.open(os.path.join(diff_dir, entry.split()[2] + ".gz")) as f:
+                lines = apply_ed_script(lines, f.read())
+        assert lines == versions[3]
+
+    def test_size_limit(self):
+        index = os.path.join(self.tmp_dir, "Index.gz")
+        self._write_index("Index.gz", ["pkg1\n"])
+        self._write_index("Index.gz.new", ["pkg1\n", "pkg2\n"])
+        update_diffs(index, index + ".new", 2)
+        os.rename(index + ".new", index)
+
+        # larger indices are not diffed, and clients can not bridge the change
+        limit = pdiff.MAX_DIFF_INPUT_SIZE
+        pdiff.MAX_DIFF_INPUT_SIZE = 8
+        try:
+            self._write_index("Index.gz.new", ["pkg1\n", "pkg2\n", "pkg3\n"])
+            update_diffs(index, index + ".new", 2)
+        finally:
+            pdiff.MAX_DIFF_INPUT_SIZE = limit
+
+        diff_dir = os.path.join(self.tmp_dir, "Index.diff")
+        assert os.listdir(diff_dir) == ["Index"]
+        with open(os.path.join(diff_dir, "Index")) as f:
+            assert f.read().startswith("SHA256-Current: %s 15\n" % (sha256("pkg1\npkg2\npkg3\n").hexdigest()))
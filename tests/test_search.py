@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+from lihub.extensions import db
+from lihub.repository import Repository, Component
+from lihub.refdata import refdata
+from lihub import search as search_module
+from lihub.search import ComponentSearch
+
+from tests import TestCase
+
+
+class TestComponentSearch(TestCase):
+
+    def setUp(self):
+        super(TestComponentSearch, self).setUp()
+        self.repo = Repository(name=u'master', toplevel=True)
+        db.session.add(self.repo)
+        db.session.commit()
+        refdata.invalidate()
+
+    def _add(self, cid, name, summary=u'An application', description=u''):
+        db.session.add(Component(cid=cid, kind=u'desktop', name=name, summary=summary,
+                                 description=description, xml=u'<component/>',
+                                 repository=self.repo))
+        db.session.commit()
+
+    def test_ranking(self):
+        self._add(u'org.example.Viewer', u'Viewer', description=u'<p>Shows images made with an editor</p>')
+        self._add(u'org.example.Editor', u'Editor', summary=u'Image editor')
+        hits = ComponentSearch().search(u'editor').items
+        assert [h.cid for h in hits] == [u'org.example.Editor', u'org.example.Viewer']
+        assert hits[0].score > hits[1].score
+
+    def test_typo(self):
+        self._add(u'org.kde.kate', u'Kate')
+        self._add(u'org.example.Gimp', u'Gimp')
+        search = ComponentSearch()
+        assert [h.cid for h in search.search(u'kaet').items] == [u'org.kde.kate']
+        assert [h.cid for h in search.search(u'kates').items] == [u'org.kde.kate']
+        # short terms have to match exactly
+        assert search.search(u'gip').items == []
+
+    def test_pagination(self):
+        for i in range(5):
+            self._add(u'org.example.Tool%i' % i, u'Tool %i' % i)
+        search = ComponentSearch()
+        first = search.search(u'tool', 1, 2)
+        last = search.search(u'tool', 3, 2)
+        assert first.total == 5
+        assert [h.name for h in first.items] == [u'Tool 0', u'Tool 1']
+        assert [h.name for h in last.items] == [u'Tool 4']
+        assert not last.has_next
+
+    def test_candidate_limit(self):
+        for i in range(5):
+            self._add(u'org.example.Tool%i' % i, u'Tool %i' % i)
+        self._add(u'org.example.Hammer', u'Hammer', summary=u'A tool', description=u'<p>A hammer tool</p>')
+        limit = search_module.MAX_CANDIDATE_POSTINGS
+        search_module.MAX_CANDIDATE_POSTINGS = 2
+        try:
+            search = ComponentSearch()
+            last = search.search(u'tool', 3, 2)
+            # the hammer is no candidate for "tool", but still scored for it
+            hammer = search.search(u'hammer tool').items
+        finally:
+            search_module.MAX_CANDIDATE_POSTINGS = limit
+        assert last.total == 6
+        assert len(last.items) == 2
+        assert hammer[0].cid == u'org.example.Hammer'
+        assert hammer[0].score > ComponentSearch().search(u'hammer').items[0].score
+
+    def test_one_hit_per_component(self):
+        search = ComponentSearch()
+        self._add(u'org.example.Notes', u'Notes')
+        assert search.search(u'notes').total == 1
+
+        # a newer package of the same component replaces its text
+        self._add(u'org.example.Notes', u'Notes', summary=u'Write down thoughts')
+        search.invalidate()
+        hits = search.search(u'notes').items
+        assert len(hits) == 1
+        assert hits[0].summary == u'Write down thoughts'
+        assert search.search(u'application').items == []
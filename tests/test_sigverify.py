@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from lihub.maintain import sigverify
+
+
+def _sig(result, fpr):
+    lines = ["[GNUPG:] NEWSIG", "[GNUPG:] %s 0000 someone" % (result)]
+    if result == "GOODSIG":
+        lines.append("[GNUPG:] VALIDSIG %s 2015-01-01" % (fpr))
+    return lines
+
+
+class TestBatchVerify(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = list()
+        self._run_command = sigverify.run_command
+        sigverify.run_command = self._fake_run_command
+
+    def tearDown(self):
+        sigverify.run_command = self._run_command
+
+    def _fake_run_command(self, command):
+        self.calls.append(command)
+        if "--verify-files" in command:
+            return ("\n".join(self.batch_output), "", 1)
+        return ("\n".join(self.single_output[command[-1]]), "", 0)
+
+    def test_unsigned_file_does_not_shift_results(self):
+        # a.dsc is signed, b.dsc is unsigned and c.dsc carries two signatures
+        self.batch_output = _sig("GOODSIG", "AAAA") + ["[GNUPG:] NODATA 1"] + \
+                            _sig("GOODSIG", "VICTIMFPR") + _sig("GOODSIG", "OTHERFPR")
+        self.single_output = {
+            "a.dsc": _sig("GOODSIG", "AAAA"),
+            "b.dsc": ["[GNUPG:] NODATA 1"],
+            "c.dsc": _sig("GOODSIG", "VICTIMFPR") + _sig("GOODSIG", "OTHERFPR"),
+        }
+
+        results = sigverify._verify_batch(("keyring.gpg", ["a.dsc", "b.dsc", "c.dsc"]))
+
+        assert results["a.dsc"] == ("AAAA", None)
+        assert results["b.dsc"][0] is None
+        assert results["b.dsc"][1] is not None
+        # the batch output was not trusted, every file was checked on its own
+        assert len(self.calls) == 4
+
+    def test_unambiguous_batch(self):
+        self.batch_output = _sig("GOODSIG", "AAAA") + _sig("BADSIG", None)
+        self.single_output = dict()
+
+        results = sigverify._verify_batch(("keyring.gpg", ["a.dsc", "b.dsc"]))
+
+        assert results["a.dsc"] == ("AAAA", None)
+        assert results["b.dsc"] == (None, "Bad signature")
+        assert len(self.calls) == 1
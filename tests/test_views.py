@@ -4,6 +4,9 @@ from werkzeug.urls import url_quote
 
 from lihub.user import User
 from lihub.extensions import db, mail
+from lihub.repository import Repository, Category, Component, Package
+from lihub.refdata import refdata
+from lihub.frontend import views as frontend_views
 
 from tests import TestCase
 
@@ -128,3 +131,52 @@ class TestAdmin(TestCase):
 
         response = self.client.get('/admin/')
         self.assertTemplateUsed('admin/index.html')
+
+
+class TestBrowseCategory(TestCase):
+
+    def setUp(self):
+        super(TestBrowseCategory, self).setUp()
+        repo = Repository(name=u'master', toplevel=True)
+        games = Category(idname=u'games', name=u'Games', description=u'')
+        names = [u'Zork', u'Chess', u'Arcade', u'Chess', u'Chess']
+        for i, name in enumerate(names):
+            cpt = Component(cid=u'org.example.Game%i' % i, kind=u'desktop', name=name,
+                            summary=u'A game', description=u'<p>A game</p>', xml=u'<component/>',
+                            repository=repo, categories=[games])
+            db.session.add(Package(name=u'game%i' % i, version=u'1.0', fname=u'pool/game%i.ipk' % i,
+                                   architecture=u'amd64', sha256sum=u'%064x' % i,
+                                   repository=repo, component=cpt))
+        db.session.commit()
+        refdata.invalidate()
+
+        self._page_size = frontend_views.CATEGORY_PAGE_SIZE
+        frontend_views.CATEGORY_PAGE_SIZE = 2
+
+    def tearDown(self):
+        frontend_views.CATEGORY_PAGE_SIZE = self._page_size
+        super(TestBrowseCategory, self).tearDown()
+
+    def _page(self, after=None):
+        url = '/browse/games'
+        if after:
+            url += '?after=' + url_quote(after)
+        self._test_get_request(url, 'frontend/category.html')
+        components = self.get_context_variable('components')
+        return [(c.name, c.cid) for c in components], self.get_context_variable('next_after')
+
+    def test_pages(self):
+        page, after = self._page()
+        assert page == [(u'Arcade', u'org.example.Game2'), (u'Chess', u'org.example.Game1')]
+
+        # components of the same name are split across pages by their ID
+        page, after = self._page(after)
+        assert page == [(u'Chess', u'org.example.Game3'), (u'Chess', u'org.example.Game4')]
+
+        page, after = self._page(after)
+        assert page == [(u'Zork', u'org.example.Game0')]
+        assert after is None
+
+    def test_invalid_after(self):
+        self.assert404(self.client.get('/browse/games?after=Chess'))
+        self.assert404(self.client.get('/browse/games?after=x:Chess'))